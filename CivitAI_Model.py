@@ -1,15 +1,24 @@
 import concurrent.futures
 import os
-import re
-import json
-import time
-import threading
 import hashlib
 import requests
-from tqdm import tqdm
 
-import comfy.utils
-import folder_paths
+from .api_cache import get_api_cache
+from .blob_store import get_blob_store
+from .disk_quota import DiskQuota, get_disk_quota, record_model_use
+from .download_budget import PRIORITY_FOREGROUND, get_download_budget
+from .download_history import get_download_history
+from .download_journal import DownloadJournal
+from .download_lock import ModelFileLock, single_flight
+from .download_progress import DownloadProgress
+from .hash_cache import get_hash_cache
+from .http_client import RETRY_STATUS, CircuitOpenError, get_retry_policy, get_session, probe
+from .metrics import inc, timed
+from .model_index import get_model_index, index_file
+from .part_file import PartFile
+from .range_hasher import RangeHasher
+from .range_scheduler import RangeScheduler
+from .utils import parse_size
 
 
 ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
@@ -28,12 +37,13 @@ class CivitAI_Model:
     '''
     api = 'https://civitai.com/api/v1'
     num_chunks = 8
-    chunk_size = 1024
-    max_retries = 120
+    chunk_size = parse_size(os.environ.get('CIVITAI_DOWNLOAD_BUFFER')) or 1024 * 1024
+    max_retries = 20
+    unknown_hash_ttl = float(os.environ.get('CIVITAI_UNKNOWN_HASH_TTL', 7 * 24 * 3600))
     debug_response = False
     warning = False
 
-    def __init__(self, model_id, save_path, model_paths, model_types=[], token=None, model_version=None, download_chunks=None, max_download_retries=None, warning=True, debug_response=False):
+    def __init__(self, model_id, save_path, model_paths, model_types=[], token=None, model_version=None, download_chunks=None, max_download_retries=None, warning=True, debug_response=False, priority=PRIORITY_FOREGROUND):
         self.model_id = model_id
         self.version = model_version
         self.type = None
@@ -49,6 +59,7 @@ class CivitAI_Model:
         self.file_size = 0
         self.trained_words = None
         self.warning = warning
+        self.priority = priority
         
         if download_chunks:
             self.num_chunks = int(download_chunks)
@@ -64,70 +75,63 @@ class CivitAI_Model:
 
         self.details()
 
+    @timed('phase', phase='details')
     def details(self):
     
         # CHECK FOR EXISTING MODEL DATA
         
         model_name = self.model_cached_name(self.model_id, self.version)
         if model_name and self.model_exists_disk(model_name):
-            history_file_path = os.path.join(ROOT_PATH, 'download_history.json')
-            if os.path.exists(history_file_path):
-                with open(history_file_path, 'r', encoding='utf-8') as history_file:
-                    download_history = json.load(history_file)
-
-                    model_id_str = str(self.model_id)
-                    version_id = int(self.version) if self.version else None
-                    file_id = int(self.file_id) if self.file_id else None
-
-                    if model_id_str in download_history:
-                        file_details_list = download_history[model_id_str]
-                        for file_details in file_details_list:
-                            files = file_details.get('files')
-                            model_version = file_details.get('id')
-                            if model_version and model_version == version_id:
-                                if files:
-                                    for file in files:
-                                        file_version = file.get('id')
-                                        name = file.get('name')
-
-                                        if file_id and file_id == file_version:
-                                            self.name = name
-                                            self.name_friendly = file.get('name_friendly')
-                                            self.download_url = f"{file.get('downloadUrl')}?token={self.token}"
-                                            self.trained_words = file.get('trained_words')
-                                            self.file_details = file
-                                            self.file_id = file_version
-                                            self.model_id = self.model_id
-                                            self.version = int(file.get('id'))
-                                            self.type = file.get('model_type', 'Model')
-                                            self.file_size = file.get('sizeKB', 0) * 1024
-                                            hashes = file.get('hashes')
-                                            if hashes:
-                                                self.file_sha256 = hashes.get('SHA256')
-                                            return self.name, self.file_details
-
-                                        elif self.model_exists_disk(name):
-                                            self.name = name
-                                            self.name_friendly = file.get('name_friendly')
-                                            self.download_url = file.get('downloadUrl')
-                                            self.trained_words = file.get('trained_words')
-                                            self.file_details = file
-                                            self.file_id = file_version
-                                            self.model_id = self.model_id
-                                            self.version = int(file.get('id'))
-                                            self.type = file.get('model_type', 'Model')
-                                            self.file_size = file.get('sizeKB', 0) * 1024
-                                            hashes = file.get('hashes')
-                                            if hashes:
-                                                self.file_sha256 = hashes.get('SHA256')
-                                            return self.name, self.file_details
-                                            
-                    del download_history
+            version_id = int(self.version) if self.version else None
+            file_id = int(self.file_id) if self.file_id else None
+
+            for model_version, file in get_download_history().model_files(self.model_id):
+                if model_version and model_version == version_id:
+                    file_version = file.get('id')
+                    name = file.get('name')
+
+                    if file_id and file_id == file_version:
+                        self.name = name
+                        self.name_friendly = file.get('name_friendly')
+                        self.download_url = f"{file.get('downloadUrl')}?token={self.token}"
+                        self.trained_words = file.get('trained_words')
+                        self.file_details = file
+                        self.file_id = file_version
+                        self.model_id = self.model_id
+                        self.version = int(file.get('id'))
+                        self.type = file.get('model_type', 'Model')
+                        self.file_size = file.get('sizeKB', 0) * 1024
+                        hashes = file.get('hashes')
+                        if hashes:
+                            self.file_sha256 = hashes.get('SHA256')
+                        return self.name, self.file_details
+
+                    elif self.model_exists_disk(name):
+                        self.name = name
+                        self.name_friendly = file.get('name_friendly')
+                        self.download_url = file.get('downloadUrl')
+                        self.trained_words = file.get('trained_words')
+                        self.file_details = file
+                        self.file_id = file_version
+                        self.model_id = self.model_id
+                        self.version = int(file.get('id'))
+                        self.type = file.get('model_type', 'Model')
+                        self.file_size = file.get('sizeKB', 0) * 1024
+                        hashes = file.get('hashes')
+                        if hashes:
+                            self.file_sha256 = hashes.get('SHA256')
+                        return self.name, self.file_details
  
         # NO CACHE DATA FOUND | DOWNLOAD MODEL DETAILS
 
         model_url = f'{self.api}/models/{self.model_id}'
-        response = requests.get(model_url)
+        response = get_api_cache().get(model_url)
+
+        # A cached answer predates any version published since; ask CivitAI again for a version it doesn't list
+        if response.status_code == 200 and self.version and getattr(response, 'from_cache', False):
+            cached_versions = response.json().get('modelVersions') or []
+            if not any(str(version.get('id')) == str(self.version) for version in cached_versions):
+                response = get_api_cache().get(model_url, ttl=0)
 
         if response.status_code == 200:
             model_data = response.json()
@@ -142,7 +146,6 @@ class CivitAI_Model:
             model_versions = model_data.get('modelVersions')
             model_type = model_data.get('type', 'Model')
             self.type = model_type
-            model_friendly_name = model_data.get('name', 'Unknown')
 
             if model_type not in self.valid_types:
                 raise Exception(f"{ERR_PREFIX}The model you requested is not a valid `{', '.join(self.valid_types)}`. Aborting!")
@@ -168,6 +171,7 @@ class CivitAI_Model:
                                 if hashes:
                                     self.file_sha256 = hashes.get('SHA256')
                                 return self.download_url, self.file_details
+                raise Exception(f"{ERR_PREFIX}Version `{self.version}` of model `{self.model_id}` was not found on CivitAI.")
             else:
                 version = model_versions[0]
                 if version:
@@ -194,77 +198,8 @@ class CivitAI_Model:
         else:
             raise Exception(f"{ERR_PREFIX}No cached model or model data found, and unable to reach CivitAI! Response Code: {response.status_code}\n Please try again later.")
 
+    @timed('phase', phase='download')
     def download(self):
-    
-        # DOWNLAOD BYTE CHUNK
-        
-        def download_chunk(chunk_id, url, chunk_size, start_byte, end_byte, file_path, total_pbar, comfy_pbar, max_retries=30):
-            retries = 0
-            retry_delay = 5
-            chunk_complete = False
-            downloaded_bytes = 0
-
-            while retries <= max_retries:
-                try:
-                    headers = {'Range': f'bytes={start_byte + downloaded_bytes}-{end_byte}'}
-                    response = requests.get(url, headers=headers, stream=True, timeout=10)
-                    if response.status_code == 206:
-                        with open(file_path, 'r+b') as file:
-                            if retries > 0:
-                                print(f"{MSG_PREFIX}Chunk {chunk_id} re-established in {retry_delay}s")
-                                total_pbar.update()
-                                time.sleep(retry_delay * 10)
-                                total_pbar.set_postfix_str('')
-
-                            file.seek(start_byte + downloaded_bytes) 
-                            for chunk in response.iter_content(chunk_size=chunk_size):
-                                file.write(chunk)
-                                total_pbar.update(len(chunk))
-                                comfy_pbar.update(len(chunk))
-                                downloaded_bytes += len(chunk)
-                                retries = 0
-                                if start_byte + downloaded_bytes >= end_byte:
-                                    chunk_complete = True
-                                    break
-
-                            comfy_pbar.set_postfix_str(f"Chunk {chunk_id}: {downloaded_bytes} bytes downloaded")
-                    else:
-                        raise Exception(f"{ERR_PREFIX}Unable to establish download connection.")
-                except (requests.exceptions.RequestException, Exception) as e:
-                    # We shouldn't warn on chunk loss, since end chunks may not be able to be established due to remaining filesize
-                    #print(f"{WARN_PREFIX}Chunk {chunk_id} connection lost") 
-                    total_pbar.update()
-                    time.sleep(retry_delay)
-                    retries += 1
-                    if retries > max_retries:
-                        print(f"{ERR_PREFIX}Chunk {chunk_id} failed to download after {max_retries} retries.")
-                        break
-
-                if chunk_complete:
-                    break
-                    
-            if not chunk_complete:
-                raise Exception(f"{ERR_PREFIX}Unable to re-establish connection to CivitAI.")
-
-                
-        # GET FILE SIZE
-        
-        def get_total_file_size(url):
-            response = requests.get(url, stream=True)
-            content_length = response.headers.get('Content-Length')
-            if content_length is not None and content_length.isdigit():
-                return int(content_length)
-
-            response = requests.get(url, headers={'Range': 'bytes=0-999999999'}, stream=True)
-            content_range = response.headers.get('Content-Range')
-            if content_range:
-                total_bytes = int(re.search(r'/(\d+)', content_range).group(1))
-                return total_bytes
-                
-            if self.file_size:
-                return self.file_size
-
-            return None
 
         # RESOLVE MODEL ID/VERSION TO FILENAME
 
@@ -281,133 +216,247 @@ class CivitAI_Model:
                     self.name = model_name
                     return True
 
+        # One ranged request resolves redirects, size, filename and range support
+
+        download_probe = None
+
         if not self.name:
-            response = requests.head(self.download_url)
-            if 'Content-Disposition' in response.headers:
-                content_disposition = response.headers['Content-Disposition']
-                self.name = re.findall("filename=(.+)", content_disposition)[0].strip('"')
+            download_probe = probe(self.download_url)
+            if download_probe.filename:
+                self.name = download_probe.filename
             else:
                 self.name = self.download_url.split('/')[-1]
 
-        # NO MODEL FOUND! | DOWNLOAD MODEL FROM CIVITAI
-
-        print(f"{MSG_PREFIX}Downloading `{self.name}` from `{self.download_url}`")
         save_path = os.path.join(self.model_path, self.name) # Assume default comfy folder, unless we take user input on extra paths
+
+        # Concurrent requests for the same file in this process share one download
+        return single_flight(os.path.realpath(save_path), lambda: self.download_file(save_path, download_probe))
+
+    def download_file(self, save_path, download_probe=None):
+    
+        # DOWNLAOD BYTE SEGMENT
         
-        # EXISTING MODEL FOUND -- CHECK SHA256
-        
-        if os.path.exists(save_path):
-            print(f"{MSG_PREFIX}{self.type} file already exists at: {save_path}")
-            self.dump_file_details()
-            existing_sha256 = CivitAI_Model.calculate_sha256(save_path)
-            if existing_sha256 == self.file_sha256:
-                print(f"{MSG_PREFIX}{self.type} SHA256: {existing_sha256}")
-                return True
-            else:
-                print(f"{ERR_PREFIX}Existing {self.type} file's SHA256 does not match. Retrying download...")
+        def download_chunk(chunk_id, url, chunk_size, segment, scheduler, part_file, progress, hasher, journal, max_retries=30):
+            retries = 0
+
+            while True:
+                response = None
+                try:
+                    # While the host's circuit breaker is open, wait for its trial request instead of failing
+                    retry_policy.check(url, timeout=retry_policy.reset_timeout + retry_policy.max_delay)
+                    headers = {'Range': f'bytes={segment.position}-{segment.end}'}
+                    response = get_session().get(url, headers=headers, stream=True, timeout=10)
+                    retry_policy.record(url, response)
+                    if response.status_code == 206 or (response.status_code == 200 and segment.position == 0):
+                        if retries > 0:
+                            print(f"{MSG_PREFIX}Chunk {chunk_id} re-established after {retries} retries")
+
+                        # MiB-sized reads, each written with one positional write and one progress update.
+                        # The stream is closed on every way out, so its pooled connection goes back right away
+                        try:
+                            for chunk in response.iter_content(chunk_size=chunk_size):
+                                offset = segment.position
+                                length = scheduler.claim(segment, offset, len(chunk))
+                                if length:
+                                    budget.consume(length)
+                                    part_file.pwrite(memoryview(chunk)[:length], offset)
+                                    hasher.mark(offset, length)
+                                    journal.mark(offset, length)
+                                    progress.update(length)
+                                    retries = 0
+                                if segment.remaining <= 0:
+                                    return
+                        finally:
+                            response.close()
+                        raise requests.exceptions.ChunkedEncodingError("Connection closed before the segment was complete")
+                    else:
+                        response.close()
+                        if response.status_code in (401, 403, 410) and url != self.download_url:
+                            # Resolved CDN URL expired, go back through the API redirect
+                            url = self.download_url
+                        elif response.status_code not in RETRY_STATUS:
+                            raise Exception(f"{ERR_PREFIX}Unable to establish download connection. Status code: {response.status_code}")
+                except requests.exceptions.RequestException as e:
+                    # We shouldn't warn on chunk loss, since end chunks may not be able to be established due to remaining filesize
+                    #print(f"{WARN_PREFIX}Chunk {chunk_id} connection lost") 
+                    retry_policy.record(url, error=e)
+                    response = None
+                except CircuitOpenError:
+                    # Still down after waiting out a trial; counts as one more retry
+                    response = None
+
+                retries += 1
+                inc('download_retries')
+                if retries > max_retries:
+                    print(f"{ERR_PREFIX}Chunk {chunk_id} failed to download after {max_retries} retries.")
+                    raise Exception(f"{ERR_PREFIX}Unable to re-establish connection to CivitAI.")
+                retry_policy.wait(retries, response)
+
+        # DOWNLOAD WORKER | TAKES SEGMENTS UNTIL THE SCHEDULER RUNS DRY
+
+        def download_worker(worker_id, url, chunk_size, scheduler, part_file, progress, hasher, journal, max_retries=30):
+            while True:
+                segment = scheduler.acquire(worker_id)
+                if segment is None:
+                    return
+                try:
+                    # Every download in the process shares one connection budget; higher priority goes first
+                    with budget.connection(lambda: self.priority):
+                        download_chunk(worker_id, url, chunk_size, segment, scheduler, part_file, progress, hasher, journal, max_retries)
+                except Exception:
+                    scheduler.fail()
+                    raise
+                finally:
+                    scheduler.release(segment)
+
+        budget = get_download_budget()
+        retry_policy = get_retry_policy()
+
+        # With a blob store configured, bytes are stored once per SHA256 and linked into place
+
+        blob_store = get_blob_store() if self.file_sha256 else None
+        target_path = blob_store.prepare(self.file_sha256) if blob_store else save_path
+
+        # Other processes sharing this model directory wait here until we are done
 
-        # NO MODEL OR MODEL DATA AVAILABLE -- DOWNLOAD MODEL FROM CIVITAI
+        with ModelFileLock(target_path):
 
-        response = requests.head(self.download_url)
-        total_file_size = total_file_size = get_total_file_size(self.download_url)
+            # NO MODEL FOUND! | DOWNLOAD MODEL FROM CIVITAI
+
+            print(f"{MSG_PREFIX}Downloading `{self.name}` from `{self.download_url}`")
         
-        response = requests.get(self.download_url, stream=True)
-        if response.status_code != requests.codes.ok:
-            raise Exception(f"{ERR_PREFIX}Failed to download {self.type} file from CivitAI. Status code: {response.status_code}")
-            
-        with open(save_path, 'wb') as file:
-            file.seek(total_file_size - 1)
-            file.write(b'\0')
-
-        futures = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.num_chunks) as executor:
-            total_pbar = tqdm(total=total_file_size, unit='B', unit_scale=True, unit_divisor=1024, leave=True)
-            comfy_pbar = comfy.utils.ProgressBar(total_file_size)
-            comfy_pbar.update(0)
-            for i in range(self.num_chunks):
-                start_byte = i * (total_file_size // self.num_chunks)
-                end_byte = start_byte + (total_file_size // self.num_chunks) - 1
-                if i == self.num_chunks - 1:
-                    end_byte = total_file_size - 1
-                future = executor.submit(download_chunk, i, self.download_url, self.chunk_size, start_byte, end_byte, save_path, total_pbar, comfy_pbar, self.max_retries)
-                futures.append(future)
-
-            for future in futures:
-                future.result()
-                
-            total_pbar.close()
-        model_sha256 = CivitAI_Model.calculate_sha256(save_path)
-        if model_sha256 == self.file_sha256:
-            print(f"{MSG_PREFIX}Loading {self.type}: {self.name} (https://civitai.com/models/{self.model_id}/?modelVersionId={self.version})")
-            print(f"{MSG_PREFIX}{self.type} SHA256: {model_sha256}")
-            self.dump_file_details()
-            return True
-        else:
-            os.remove(save_path)  # Remove Invalid / Broken / Insecure download file
-            raise Exception(f"{ERR_PREFIX}{self.type} file's SHA256 does not match expected value after retry. Aborting download.")
+            # EXISTING MODEL FOUND -- CHECK SHA256
+        
+            if os.path.exists(save_path):
+                print(f"{MSG_PREFIX}{self.type} file already exists at: {save_path}")
+                self.dump_file_details()
+                existing_sha256 = CivitAI_Model.calculate_sha256(save_path)
+                if existing_sha256 == self.file_sha256:
+                    print(f"{MSG_PREFIX}{self.type} SHA256: {existing_sha256}")
+                    inc('downloads', result='existing')
+                    return True
+                else:
+                    print(f"{ERR_PREFIX}Existing {self.type} file's SHA256 does not match. Retrying download...")
+
+            # IDENTICAL FILE ALREADY IN THE BLOB STORE -- LINK IT
+
+            if blob_store and blob_store.has(self.file_sha256):
+                if CivitAI_Model.calculate_sha256(target_path) == self.file_sha256:
+                    link_type = blob_store.materialize(self.file_sha256, save_path)
+                    index_file(save_path)
+                    record_model_use(save_path, DiskQuota.folder_for_paths(self.model_paths), self.model_id, self.version, downloaded=True, used=False)
+                    print(f"{MSG_PREFIX}Linked {self.type} `{self.name}` from blob store ({link_type}): {target_path}")
+                    self.dump_file_details()
+                    inc('downloads', result='linked')
+                    return True
+                os.remove(target_path)  # Remove corrupt blob
+
+            # NO MODEL OR MODEL DATA AVAILABLE -- DOWNLOAD MODEL FROM CIVITAI
+
+            if not download_probe:
+                download_probe = probe(self.download_url)
+            if not download_probe.ok:
+                raise Exception(f"{ERR_PREFIX}Failed to download {self.type} file from CivitAI. Status code: {download_probe.status_code}")
+
+            total_file_size = download_probe.total_size or self.file_size
+            if not total_file_size:
+                raise Exception(f"{ERR_PREFIX}Unable to determine {self.type} file size from CivitAI. Aborting download.")
+
+            # Workers fetch from the resolved (post-redirect) URL so each range skips the redirect round trip
+            file_url = download_probe.url or self.download_url
+            num_workers = self.num_chunks if download_probe.accept_ranges else 1
+
+            # Bytes land in `<name>.part` with a journal of completed ranges, so a restarted
+            # download only fetches what is missing and never exposes a half-written model
+            journal = DownloadJournal(target_path, total_file_size, sha256=self.file_sha256, url=self.download_url, etag=download_probe.etag)
+            resumed_bytes = journal.resume() if download_probe.accept_ranges else 0
+            if resumed_bytes:
+                print(f"{MSG_PREFIX}Resuming download of `{self.name}` ({resumed_bytes} of {total_file_size} bytes already on disk)")
+
+            # Check the folder quota and free space (evicting old downloads if needed) before preallocating
+            get_disk_quota().make_room(
+                os.path.dirname(target_path),
+                total_file_size - resumed_bytes,
+                folder=DiskQuota.folder_for_paths(self.model_paths),
+                exclude=(os.path.abspath(save_path),),
+            )
+            journal.prepare()
+
+            # Hash the file while it is being written, so verification does not need a second full read
+            hasher = RangeHasher(journal.part_path, total_file_size).start()
+            for start, end in journal.completed:
+                hasher.mark(start, end - start)
+
+            # Small segments in a shared queue; idle workers steal from slow ones and the
+            # number of live connections adapts to throughput, bounded by `download_chunks`
+            if download_probe.accept_ranges:
+                scheduler = RangeScheduler(total_file_size, num_workers, ranges=journal.missing())
+            else:
+                scheduler = RangeScheduler(total_file_size, 1, segment_size=total_file_size, steal=False, adaptive=False)
+
+            # All workers write through one descriptor with positional writes and only bump
+            # their own progress counters; one ticker thread publishes progress to tqdm and ComfyUI
+            futures = []
+            with PartFile(journal.part_path) as part_file, \
+                    DownloadProgress(self.name, total_file_size, initial=resumed_bytes) as progress, \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+                for i in range(num_workers):
+                    future = executor.submit(download_worker, i, file_url, self.chunk_size, scheduler, part_file, progress, hasher, journal, self.max_retries)
+                    futures.append(future)
+
+                try:
+                    while True:
+                        done, pending = concurrent.futures.wait(futures, timeout=scheduler.sample_interval, return_when=concurrent.futures.FIRST_EXCEPTION)
+                        for future in done:
+                            future.result()
+                        if not pending:
+                            break
+                        scheduler.adjust()
+                except Exception:
+                    scheduler.fail()
+                    hasher.abort()
+                    journal.flush()
+                    raise
+
+            model_sha256 = hasher.finish()
+            if not model_sha256:
+                model_sha256 = CivitAI_Model.calculate_sha256(journal.part_path, use_cache=False)
+            if model_sha256 == self.file_sha256:
+                journal.finalize()
+                get_hash_cache().put(target_path, model_sha256)
+                if blob_store:
+                    blob_store.materialize(self.file_sha256, save_path)
+                    get_hash_cache().put(save_path, model_sha256)
+                index_file(save_path)
+                record_model_use(save_path, DiskQuota.folder_for_paths(self.model_paths), self.model_id, self.version, downloaded=True, used=False)
+                print(f"{MSG_PREFIX}Loading {self.type}: {self.name} (https://civitai.com/models/{self.model_id}/?modelVersionId={self.version})")
+                print(f"{MSG_PREFIX}{self.type} SHA256: {model_sha256}")
+                self.dump_file_details()
+                inc('downloads', result='downloaded')
+                return True
+            else:
+                journal.discard()  # Remove Invalid / Broken / Insecure download file
+                inc('downloads', result='corrupt')
+                raise Exception(f"{ERR_PREFIX}{self.type} file's SHA256 does not match expected value after retry. Aborting download.")
     
     # DUMP MODEL DETAILS TO DOWNLOAD HISTORY
     
     def dump_file_details(self):
-        history_file_path = os.path.join(ROOT_PATH, 'download_history.json')
-
         if not self.file_details:
             return
 
-        if os.path.exists(history_file_path):
-            with open(history_file_path, 'r', encoding='utf-8') as history_file:
-                download_history = json.load(history_file)
-        else:
-            download_history = {}
-
-        model_id_str = str(self.model_id)
-        if model_id_str in download_history:
-            model_versions = download_history[model_id_str]
-            for version_details in model_versions:
-                if version_details.get('id') == self.version:
-                    files = version_details.get('files', [])
-                    for file_details in files:
-                        if file_details.get('downloadUrl') == self.download_url:
-                            return
-
-                    version_details.setdefault('files', []).append(self.file_details)
-                    break
-            else:
-                download_history[model_id_str].append({
-                    'id': self.version,
-                    'files': [self.file_details],
-                })
-        else:
-            download_history[model_id_str] = [{
-                'id': self.version,
-                'files': [self.file_details],
-            }]
-
-        with open(history_file_path, 'w', encoding='utf-8') as history_file:
-            json.dump(download_history, history_file, indent=4, ensure_ascii=False)
+        get_download_history().add(self.model_id, self.version, self.file_details)
             
     # RESOLVE ID/VERSION TO FILENAME
 
     def model_cached_name(self, model_id, version_id):
-        history_file_path = os.path.join(ROOT_PATH, 'download_history.json')
-
-        if os.path.exists(history_file_path):
-            with open(history_file_path, 'r') as history_file:
-                download_history = json.load(history_file)
-                model_id_str = str(model_id)
-                version_id = int(version_id) if version_id else None
-                if model_id_str in download_history:
-                    file_details_list = download_history[model_id_str]
-                    for file_details in file_details_list:                        
-                        version = file_details.get('id')
-                        files = file_details.get('files')
-                        if files:
-                            for file in files:
-                                name = file.get('name')
-                                if version_id and version_id == version:
-                                    return name
-                                elif self.model_exists_disk(name):
-                                    return name
+        version_id = int(version_id) if version_id else None
+        for version, file in get_download_history().model_files(model_id):
+            name = file.get('name')
+            if version_id and version_id == version:
+                return name
+            elif self.model_exists_disk(name):
+                return name
         return None
         
 
@@ -428,22 +477,16 @@ class CivitAI_Model:
 
     def model_path(filename, search_paths):
         filename, _ = os.path.splitext(filename)
-        for path in search_paths:
-            print(path)
-            for root, dirs, files in os.walk(path):
-                for file in files:
-                    name, ext = os.path.splitext(file)
-                    print(name)
-                    if name.lower() == filename.lower():
-                        return os.path.join(root, file)
-        return None
+        return get_model_index(search_paths).find(filename)
 
     # CALCULATE SHA256
 
     @staticmethod
-    def calculate_sha256(file_path):
-        sha256_hash = hashlib.sha256()
+    def calculate_sha256(file_path, use_cache=True):
         if file_path and os.path.exists(file_path):
+            if use_cache:
+                return get_hash_cache().sha256(file_path)
+            sha256_hash = hashlib.sha256()
             with open(file_path, "rb") as f:
                 for byte_block in iter(lambda: f.read(4096), b""):
                     sha256_hash.update(byte_block)
@@ -452,27 +495,34 @@ class CivitAI_Model:
         
     # STATIC HASH LOOKUP FOR MANUAL LOADING
     @staticmethod
-    def sha256_lookup(file_path):
+    @timed('phase', phase='sha256_lookup')
+    def sha256_lookup(file_path, refresh=False):
+        # Nothing to hash or look up for a model that didn't resolve to a file
+        if not file_path:
+            return (None, None, None)
         hash_value = CivitAI_Model.calculate_sha256(file_path)
 
-        history_file_path = os.path.join(ROOT_PATH, 'download_history.json')
-        if os.path.exists(history_file_path):
-            with open(history_file_path, 'r', encoding='utf-8') as history_file:
-                download_history = json.load(history_file)
+        cached = get_download_history().find_by_sha256(hash_value)
+        if cached:
+            model_id, version_id, file_details = cached
+            model_type = file_details.get('model_type', 'Model')
+            print(f"{MSG_PREFIX}Loading {model_type}: {os.path.basename(file_path)} (https://civitai.com/models/{model_id}/?modelVersionId={version_id})")
+            print(f"{MSG_PREFIX}{model_type} Sha256: {hash_value}")
+            return (model_id, version_id, file_details)
 
-            for model_id, model_versions in download_history.items():
-                for version in model_versions:
-                    version_id = version.get('id')
-                    if version_id:
-                        for file_details in version.get('files', []):
-                            if file_details and file_details.get('hashes', {}).get('SHA256', '').upper() == hash_value:
-                                model_type = file_details.get('model_type', 'Model')
-                                print(f"{MSG_PREFIX}Loading {model_type}: {os.path.basename(file_path)} (https://civitai.com/models/{model_id}/?modelVersionId={version_id})")
-                                print(f"{MSG_PREFIX}{model_type} Sha256: {hash_value}")
-                                return (model_id, version_id, file_details)
+        # Private merges and local trainings are unknown to CivitAI; don't ask again until the entry expires
+        if refresh:
+            get_download_history().clear_unknown_hashes(hash_value)
+        elif get_download_history().is_unknown_hash(hash_value, CivitAI_Model.unknown_hash_ttl):
+            return (None, None, None)
 
         api = f"{CivitAI_Model.api}/model-versions/by-hash/{hash_value}"
-        response = requests.get(api)
+        try:
+            response = get_api_cache().get(api)
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            # A local model still loads while CivitAI is unreachable, it just isn't identified
+            print(f"{WARN_PREFIX}Unable to look up {os.path.basename(file_path)} on CivitAI: {e}")
+            return (None, None, None)
 
         if response.status_code == 200:
             model_details = response.json()
@@ -496,56 +546,27 @@ class CivitAI_Model:
                     else:
                         if CivitAI_Model.warning:
                             print(f"{WARN_PREFIX}Unable to determine `{os.path.basename(file_path)}` source on CivitAI.")
+            get_download_history().mark_unknown_hash(hash_value)
         else:
             if CivitAI_Model.warning:
                 print(f"{WARN_PREFIX}Unable to determine `{os.path.basename(file_path)}` source on CivitAI.")
+            if response.status_code == 404:
+                get_download_history().mark_unknown_hash(hash_value)
 
         return (None, None, None)
 
+    # FORGET CACHED "UNKNOWN ON CIVITAI" HASHES
+
+    @staticmethod
+    def refresh_unknown_hashes(sha256=None):
+        get_download_history().clear_unknown_hashes(sha256)
+
     # STATIC DOWNLOAD HISTORY PUSH
 
     @staticmethod
     def push_download_history(model_id, model_type, file_details):
-        history_file_path = os.path.join(ROOT_PATH, 'download_history.json')
-
         if not file_details:
             return
 
         file_details['model_type'] = model_type
-
-        if os.path.exists(history_file_path):
-            with open(history_file_path, 'r', encoding='utf-8') as history_file:
-                download_history = json.load(history_file)
-
-                model_id_str = str(model_id)
-                if model_id_str in download_history:
-                    model_versions = download_history[model_id_str]
-                    for version_details in model_versions:
-                        if version_details.get('id') == file_details.get('id'):
-                            files = version_details.get('files', [])
-                            for file_info in files:
-                                if file_info.get('downloadUrl') == file_details.get('downloadUrl'):
-                                    return
-
-                            version_details.setdefault('files', []).append(file_details)
-                            break
-                    else:
-                        download_history[model_id_str].append({
-                            'id': file_details.get('id'),
-                            'files': [file_details],
-                        })
-                else:
-                    download_history[model_id_str] = [{
-                        'id': file_details.get('id'),
-                        'files': [file_details],
-                    }]
-        else:
-            download_history = {
-                str(model_id): [{
-                    'id': file_details.get('id'),
-                    'files': [file_details],
-                }]
-            }
-
-        with open(history_file_path, 'w', encoding='utf-8') as history_file:
-            json.dump(download_history, history_file, indent=4, ensure_ascii=False)
+        get_download_history().add(model_id, file_details.get('id'), file_details)
@@ -1,14 +1,30 @@
+# The node modules import ComfyUI's loaders, `requests` and the caches inside the
+# functions that run a node, so registering the nodes at startup stays cheap
 from .civitai_lora_loader import CivitAI_LORA_Loader
 from .civitai_checkpoint_loader import CivitAI_Checkpoint_Loader
+from .civitai_lora_stack import CivitAI_Lora_Stack
+from .metrics import add_routes as add_metrics_routes
+from .prefetch import on_prompt as prefetch_on_prompt
 
 NODE_CLASS_MAPPINGS = {
     "CivitAI_Lora_Loader": CivitAI_LORA_Loader,
-    "CivitAI_Checkpoint_Loader": CivitAI_Checkpoint_Loader
+    "CivitAI_Checkpoint_Loader": CivitAI_Checkpoint_Loader,
+    "CivitAI_Lora_Stack": CivitAI_Lora_Stack
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "CivitAI_Lora_Loader": "CivitAI Lora Loader",
-    "CivitAI_Checkpoint_Loader": "CivitAI Checkpoint Loader"
+    "CivitAI_Checkpoint_Loader": "CivitAI Checkpoint Loader",
+    "CivitAI_Lora_Stack": "CivitAI Lora Stack"
 }
 
+# Start downloading every AIR a prompt references as soon as it is queued,
+# and serve download / lookup metrics on `/civitai/metrics`
+try:
+    from server import PromptServer
+    PromptServer.instance.add_on_prompt_handler(prefetch_on_prompt)
+    add_metrics_routes(PromptServer.instance)
+except (ImportError, AttributeError):
+    pass
+
 __all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS']
\ No newline at end of file
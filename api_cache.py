@@ -0,0 +1,176 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+from .http_client import CircuitOpenError, request
+from .metrics import inc
+
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+API_CACHE_PATH = os.path.join(ROOT_PATH, 'api_cache.db')
+
+
+class CachedResponse:
+    '''
+    Minimal stand-in for `requests.Response` returned by `ApiCache.get`
+    '''
+
+    def __init__(self, status_code, body, from_cache=False):
+        self.status_code = status_code
+        self.body = body
+        self.from_cache = from_cache
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class ApiCache:
+    '''
+    On-disk TTL cache for CivitAI API responses
+
+    Successful responses are kept for `ttl` seconds. Once stale, they are
+    revalidated with If-None-Match / If-Modified-Since when the origin sent an
+    ETag or Last-Modified. The cache is capped at `max_bytes` and evicts the
+    least recently used responses first.
+    '''
+    ttl = 3600
+    max_bytes = 64 * 1024 * 1024
+    timeout = 30
+
+    def __init__(self, db_path=API_CACHE_PATH, ttl=None, max_bytes=None):
+        self.db_path = db_path
+        if ttl is not None:
+            self.ttl = float(ttl)
+        if max_bytes is not None:
+            self.max_bytes = int(max_bytes)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.initialized = False
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn = conn
+        if not self.initialized:
+            with self.lock:
+                if not self.initialized:
+                    with conn:
+                        conn.execute('''
+                            CREATE TABLE IF NOT EXISTS responses (
+                                url TEXT PRIMARY KEY,
+                                body TEXT NOT NULL,
+                                etag TEXT,
+                                last_modified TEXT,
+                                fetched_at REAL NOT NULL,
+                                accessed_at REAL NOT NULL,
+                                size INTEGER NOT NULL
+                            )
+                        ''')
+                        conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses (accessed_at)')
+                    self.initialized = True
+        return conn
+
+    # FETCH WITH CACHE
+
+    def get(self, url, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        conn = self.connection()
+        now = time.time()
+        row = conn.execute(
+            'SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?', (url,)
+        ).fetchone()
+
+        if row:
+            body, etag, last_modified, fetched_at = row
+            if now - fetched_at < ttl:
+                self.touch(url, now)
+                inc('api_cache', result='hit')
+                return CachedResponse(200, body, from_cache=True)
+
+        headers = {}
+        if row and row[1]:
+            headers['If-None-Match'] = row[1]
+        if row and row[2]:
+            headers['If-Modified-Since'] = row[2]
+
+        try:
+            response = request('GET', url, headers=headers, timeout=self.timeout)
+        except (requests.exceptions.RequestException, CircuitOpenError):
+            if not row:
+                inc('api_cache', result='error')
+                raise
+            # CivitAI is unreachable; a stale answer beats none
+            inc('api_cache', result='stale')
+            return CachedResponse(200, row[0], from_cache=True)
+
+        if response.status_code == 304 and row:
+            with conn:
+                conn.execute('UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE url = ?', (now, now, url))
+            inc('api_cache', result='revalidated')
+            return CachedResponse(200, row[0], from_cache=True)
+
+        inc('api_cache', result='miss')
+        if response.status_code == 200:
+            self.put(url, response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            return CachedResponse(200, response.text)
+
+        return CachedResponse(response.status_code, response.text)
+
+    # STORAGE
+
+    def touch(self, url, now):
+        conn = self.connection()
+        with conn:
+            conn.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (now, url))
+
+    def put(self, url, body, etag=None, last_modified=None):
+        size = len(body.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO responses (url, body, etag, last_modified, fetched_at, accessed_at, size) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, body, etag, last_modified, now, now, size)
+            )
+        self.evict()
+
+    def evict(self):
+        conn = self.connection()
+        with conn:
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for url, size in conn.execute('SELECT url, size FROM responses ORDER BY accessed_at').fetchall():
+                conn.execute('DELETE FROM responses WHERE url = ?', (url,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def invalidate(self, url=None):
+        conn = self.connection()
+        with conn:
+            if url:
+                conn.execute('DELETE FROM responses WHERE url = ?', (url,))
+            else:
+                conn.execute('DELETE FROM responses')
+
+
+_api_cache = None
+
+
+def get_api_cache():
+    global _api_cache
+    if _api_cache is None:
+        _api_cache = ApiCache(
+            ttl=os.environ.get('CIVITAI_API_CACHE_TTL'),
+            max_bytes=os.environ.get('CIVITAI_API_CACHE_MAX_BYTES'),
+        )
+    return _api_cache
@@ -0,0 +1,158 @@
+'''
+Benchmark: static range split vs. the adaptive work-stealing RangeScheduler
+
+Serves a synthetic multi-GB file from a local HTTP range server that throttles
+every connection, and makes every Nth connection much slower to stand in for
+a bad route to the CDN. Both arms drive the same RangeScheduler; the static
+arm is configured like the old downloader (one range per worker, no stealing,
+fixed concurrency).
+
+    python benchmarks/bench_download.py --size 2G --workers 8
+'''
+import argparse
+import itertools
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from range_scheduler import RangeScheduler  # noqa: E402
+
+
+BLOCK = os.urandom(1024 * 1024)
+
+
+def parse_size(value):
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([KMG]?)i?B?', value.strip(), re.IGNORECASE)
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid size: {value}")
+    scale = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}[match.group(2).upper()]
+    return int(float(match.group(1)) * scale)
+
+
+# THROTTLED RANGE SERVER
+
+def make_server(total_size, rate, slow_rate, slow_every):
+    counter = itertools.count(1)
+
+    class RangeHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            start, end = 0, total_size - 1
+            match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if match:
+                start = int(match.group(1))
+                end = min(int(match.group(2)) if match.group(2) else end, total_size - 1)
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{total_size}')
+            else:
+                self.send_response(200)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+
+            connection_rate = slow_rate if slow_every and next(counter) % slow_every == 0 else rate
+            position = start
+            began = time.monotonic()
+            sent = 0
+            try:
+                while position <= end:
+                    offset = position % len(BLOCK)
+                    piece = BLOCK[offset:offset + min(64 * 1024, end - position + 1)]
+                    self.wfile.write(piece)
+                    position += len(piece)
+                    sent += len(piece)
+                    delay = sent / connection_rate - (time.monotonic() - began)
+                    if delay > 0:
+                        time.sleep(delay)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# CLIENT
+
+def run_download(url, file_path, total_size, scheduler, workers, adjust=True):
+    with open(file_path, 'wb') as file:
+        file.truncate(total_size)
+
+    def worker(worker_id):
+        with open(file_path, 'r+b', buffering=0) as file:
+            while True:
+                segment = scheduler.acquire(worker_id)
+                if segment is None:
+                    return
+                try:
+                    request = urllib.request.Request(url, headers={'Range': f'bytes={segment.position}-{segment.end}'})
+                    with urllib.request.urlopen(request, timeout=30) as response:
+                        file.seek(segment.position)
+                        while segment.remaining > 0:
+                            chunk = response.read(64 * 1024)
+                            if not chunk:
+                                break
+                            offset = segment.position
+                            length = scheduler.claim(segment, offset, len(chunk))
+                            file.write(chunk[:length])
+                finally:
+                    scheduler.release(segment)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(worker, i) for i in range(workers)]
+        while not all(future.done() for future in futures):
+            time.sleep(0.2)
+            if adjust:
+                scheduler.adjust()
+        for future in futures:
+            future.result()
+    return time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=parse_size, default=parse_size('2G'))
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=parse_size, default=parse_size('64M'), help='bytes/s per normal connection')
+    parser.add_argument('--slow-rate', type=parse_size, default=parse_size('4M'), help='bytes/s per slow connection')
+    parser.add_argument('--slow-every', type=int, default=5, help='every Nth connection is slow (0 disables)')
+    parser.add_argument('--segment-size', type=parse_size, default=None)
+    args = parser.parse_args()
+
+    server = make_server(args.size, args.rate, args.slow_rate, args.slow_every)
+    url = f'http://127.0.0.1:{server.server_address[1]}/model.safetensors'
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, 'model.safetensors')
+
+        static = RangeScheduler(args.size, args.workers, segment_size=-(-args.size // args.workers), steal=False, adaptive=False)
+        results.append(('static split', run_download(url, file_path, args.size, static, args.workers, adjust=False)))
+
+        adaptive = RangeScheduler(args.size, args.workers, segment_size=args.segment_size)
+        results.append(('adaptive + stealing', run_download(url, file_path, args.size, adaptive, args.workers)))
+
+    server.shutdown()
+
+    size_mib = args.size / 1024 ** 2
+    print(f"{'scheduler':<22}{'seconds':>10}{'MiB/s':>10}")
+    for name, elapsed in results:
+        print(f"{name:<22}{elapsed:>10.2f}{size_mib / elapsed:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+'''
+Benchmark: cost of registering the nodes at ComfyUI startup
+
+Executes the package's `__init__.py` the way ComfyUI loads a custom node, in
+fresh interpreters with the stub ComfyUI modules from `stubs.py`, and reports
+the median registration time, the slowest imports it triggers (from
+`python -X importtime`) and any deferred dependency that was imported anyway.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --runs 10 --budget 30 --json import.json
+
+The exit status is 1 if the median is over `--budget` milliseconds or one of
+the deferred dependencies is imported while registering the nodes.
+'''
+import argparse
+import importlib.abc
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stubs  # noqa: E402
+
+
+PACKAGE_NAME = 'civitai_comfy_nodes_import'
+
+# Only needed once a node runs; none of these may be imported to register the nodes
+DEFERRED = ('requests', 'tqdm', 'sqlite3', 'comfy.sd', 'comfy.utils', 'nodes')
+STUBBED = ('comfy', 'comfy.sd', 'comfy.utils', 'nodes')
+
+MARKER = 'civitai-bench-import: register'
+
+
+class StubFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    '''Serves the stub ComfyUI modules through the import system, so importing one shows up in `sys.modules`.'''
+
+    def __init__(self, modules):
+        self.modules = modules
+
+    def find_spec(self, name, path, target=None):
+        if name in self.modules:
+            return importlib.util.spec_from_loader(name, self)
+        return None
+
+    def create_module(self, spec):
+        return self.modules[spec.name]
+
+    def exec_module(self, module):
+        pass
+
+
+# ONE REGISTRATION, IN A FRESH INTERPRETER
+
+def probe(models_root):
+    stubs.install(models_root)
+    modules = {name: sys.modules.pop(name) for name in STUBBED}
+    modules['comfy'].__path__ = []
+    sys.meta_path.insert(0, StubFinder(modules))
+
+    before = set(sys.modules)
+    sys.stderr.write(MARKER + '\n')
+    sys.stderr.flush()
+
+    started = time.perf_counter()
+    spec = importlib.util.spec_from_file_location(PACKAGE_NAME, os.path.join(stubs.PACKAGE_DIR, '__init__.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = module
+    spec.loader.exec_module(module)
+    elapsed = time.perf_counter() - started
+
+    imported = set(sys.modules) - before
+    print(json.dumps({
+        'seconds': elapsed,
+        'nodes': sorted(module.NODE_CLASS_MAPPINGS),
+        'deferred': [name for name in DEFERRED if name in imported],
+    }))
+    return 0
+
+
+def parse_importtime(stderr):
+    '''(self_us, cumulative_us, module) for every import after the marker line.'''
+    imports = []
+    seen_marker = False
+    for line in stderr.splitlines():
+        if line.strip() == MARKER:
+            seen_marker = True
+            continue
+        if not seen_marker or not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        imports.append((int(self_us), int(cumulative_us), name.strip()))
+    return imports
+
+
+def run_probe(models_root):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--probe', models_root],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Registering the nodes failed:\n{result.stderr[-4000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=float(os.environ.get('CIVITAI_IMPORT_BUDGET_MS', 25)), help='milliseconds allowed for registering the nodes')
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list')
+    parser.add_argument('--json', dest='json_path', default=None, help='write results to this file')
+    parser.add_argument('--probe', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        return probe(args.probe)
+
+    with tempfile.TemporaryDirectory(prefix='civitai_bench_') as data_dir:
+        runs = [run_probe(os.path.join(data_dir, 'models')) for _ in range(max(1, args.runs))]
+
+    samples = sorted(result['seconds'] for result, _ in runs)
+    median = statistics.median(samples) * 1000
+    deferred = sorted({name for result, _ in runs for name in result['deferred']})
+    _, imports = runs[len(runs) // 2]
+
+    print("import")
+    print(f"  {'register.p50':<34}{median:>14.3f} ms")
+    print(f"  {'register.max':<34}{samples[-1] * 1000:>14.3f} ms")
+    print(f"  {'register.imports':<34}{len(imports):>14d} modules")
+    print("  slowest imports (self / cumulative us):")
+    for self_us, cumulative_us, name in sorted(imports, reverse=True)[:args.top]:
+        print(f"    {self_us:>8} {cumulative_us:>8}  {name.strip()}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as results_file:
+            json.dump({
+                'import.register.p50': {'value': median, 'unit': 'ms', 'better': 'lower'},
+                'import.register.modules': {'value': len(imports), 'unit': 'modules', 'better': 'lower'},
+            }, results_file, indent=2)
+
+    failed = False
+    if deferred:
+        print(f"DEFERRED DEPENDENCIES IMPORTED: {', '.join(deferred)}")
+        failed = True
+    if median > args.budget:
+        print(f"OVER BUDGET: {median:.3f} ms > {args.budget:.3f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
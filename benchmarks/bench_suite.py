@@ -0,0 +1,274 @@
+'''
+Benchmark suite for the CivitAI nodes, runnable without ComfyUI
+
+Uses stub `comfy`/`folder_paths` modules and a local fake CivitAI server
+(see `fake_civitai.py`) to measure:
+
+    download       throughput of a full CivitAI_Model.download(), with and without injected faults
+    first_load     time from node call to a verified file for a small cold model, and for a warm one
+    hashing        SHA256 MB/s of a cold file, and the latency of a hash cache hit
+    history        migration time and lookup latency for a large download_history.json
+    model_path     lookup latency over a large model tree (hits and misses)
+
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --quick --json results.json
+    python benchmarks/bench_suite.py --baseline results.json --tolerance 0.25
+
+With `--baseline`, any metric that got worse than the baseline by more than
+`--tolerance` is reported and the exit status is 1. Needs the package's own
+dependencies (`requests`, `tqdm`) installed.
+'''
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stubs  # noqa: E402
+from bench_download import parse_size  # noqa: E402
+from fake_civitai import FakeCivitAI  # noqa: E402
+
+
+MIB = 1024 ** 2
+
+HIGHER = 'higher'
+LOWER = 'lower'
+
+
+class Results:
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, value, unit, better):
+        self.metrics[name] = {'value': value, 'unit': unit, 'better': better}
+        print(f"  {name:<34}{value:>14.3f} {unit}", flush=True)
+
+    def add_latencies(self, name, samples, unit='us', scale=1e6):
+        samples = sorted(samples)
+        self.add(f'{name}.p50', statistics.median(samples) * scale, unit, LOWER)
+        self.add(f'{name}.p99', samples[min(len(samples) - 1, int(len(samples) * 0.99))] * scale, unit, LOWER)
+
+    def regressions(self, baseline, tolerance):
+        found = []
+        for name, metric in self.metrics.items():
+            previous = baseline.get(name)
+            if not previous or not previous.get('value'):
+                continue
+            ratio = metric['value'] / previous['value']
+            worse = ratio < 1 - tolerance if metric['better'] == HIGHER else ratio > 1 + tolerance
+            if worse:
+                found.append((name, previous['value'], metric['value'], metric['unit']))
+        return found
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def latencies(fn, arguments):
+    samples = []
+    for argument in arguments:
+        started = time.perf_counter()
+        fn(argument)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+# DOWNLOADS
+
+def download(load, folder_paths, server, model, workers):
+    CivitAI_Model = load('CivitAI_Model').CivitAI_Model
+    checkpoints = folder_paths.folder_names_and_paths['checkpoints'][0]
+    civitai_model = CivitAI_Model(
+        model_id=model.model_id,
+        model_version=model.version_id,
+        model_types=['Checkpoint'],
+        token='bench',
+        save_path=checkpoints[0],
+        model_paths=checkpoints,
+        download_chunks=workers,
+    )
+    if not civitai_model.download():
+        raise RuntimeError(f"Download of {model.name} failed")
+    return civitai_model
+
+
+def bench_downloads(load, folder_paths, args, results):
+    print("download / first_load")
+    CivitAI_Model = load('CivitAI_Model').CivitAI_Model
+
+    server = FakeCivitAI(latency=args.latency, bandwidth=args.bandwidth)
+    with server:
+        CivitAI_Model.api = server.api
+        large = server.add_model(1001, 2001, 'bench_large.safetensors', args.download_size)
+        small = server.add_model(1002, 2002, 'bench_small.safetensors', args.first_load_size)
+
+        elapsed, _ = timed(download, load, folder_paths, server, large, args.workers)
+        results.add('download.throughput', args.download_size / MIB / elapsed, 'MiB/s', HIGHER)
+
+        elapsed, _ = timed(download, load, folder_paths, server, small, args.workers)
+        results.add('first_load.cold', elapsed * 1000, 'ms', LOWER)
+        elapsed, _ = timed(download, load, folder_paths, server, small, args.workers)
+        results.add('first_load.warm', elapsed * 1000, 'ms', LOWER)
+
+    if args.failure_rate or args.drop_rate:
+        server = FakeCivitAI(latency=args.latency, bandwidth=args.bandwidth, failure_rate=args.failure_rate, drop_rate=args.drop_rate, seed=1)
+        with server:
+            CivitAI_Model.api = server.api
+            faulty = server.add_model(1003, 2003, 'bench_faulty.safetensors', args.download_size)
+            elapsed, _ = timed(download, load, folder_paths, server, faulty, args.workers)
+            results.add('download.throughput_with_faults', args.download_size / MIB / elapsed, 'MiB/s', HIGHER)
+            print(f"    injected {server.stats['failures']} failures and {server.stats['drops']} dropped transfers")
+
+
+# HASHING
+
+def bench_hashing(load, data_dir, args, results):
+    print("hashing")
+    hash_cache = load('hash_cache')
+    file_path = os.path.join(data_dir, 'hash_bench.bin')
+    block = os.urandom(MIB)
+    with open(file_path, 'wb') as file:
+        for _ in range(args.hash_size // MIB):
+            file.write(block)
+
+    elapsed, _ = timed(hash_cache.hash_file, file_path)
+    results.add('hashing.throughput', args.hash_size / MIB / elapsed, 'MiB/s', HIGHER)
+
+    cache = hash_cache.get_hash_cache()
+    cache.sha256(file_path)
+    results.add_latencies('hashing.cache_hit', latencies(lambda _: cache.sha256(file_path), range(args.lookups)))
+    os.remove(file_path)
+
+
+# DOWNLOAD HISTORY
+
+def write_history_json(json_path, entries):
+    history = {}
+    for i in range(entries):
+        model_id = str(10000 + i // 3)
+        history.setdefault(model_id, []).append({
+            'id': 500000 + i,
+            'files': [{
+                'id': 900000 + i,
+                'name': f'model_{i}.safetensors',
+                'sizeKB': 2048.0,
+                'hashes': {'SHA256': f'{i:064X}'},
+                'downloadUrl': f'https://civitai.com/api/download/models/{500000 + i}',
+                'model_type': 'Checkpoint',
+            }],
+        })
+    with open(json_path, 'w', encoding='utf-8') as history_file:
+        json.dump(history, history_file)
+
+
+def bench_history(load, data_dir, args, results):
+    print("history")
+    download_history = load('download_history')
+    json_path = os.path.join(data_dir, 'history_bench.json')
+    db_path = os.path.join(data_dir, 'history_bench.db')
+    write_history_json(json_path, args.history_entries)
+
+    history = download_history.DownloadHistory(db_path, json_path)
+    elapsed, _ = timed(history.connection)
+    results.add('history.migration', elapsed, 's', LOWER)
+
+    picks = [random.randrange(args.history_entries) for _ in range(args.lookups)]
+    results.add_latencies('history.model_files', latencies(lambda i: history.model_files(str(10000 + i // 3)), picks))
+    results.add_latencies('history.find_by_sha256', latencies(lambda i: history.find_by_sha256(f'{i:064X}'), picks))
+    results.add_latencies('history.find_by_name', latencies(lambda i: history.find_by_name(f'model_{i}.safetensors'), picks))
+
+
+# MODEL PATH LOOKUP
+
+def bench_model_path(load, data_dir, args, results):
+    print("model_path")
+    utils = load('utils')
+    root = os.path.join(data_dir, 'tree')
+    names = []
+    for i in range(args.tree_files):
+        directory = os.path.join(root, f'group_{i % 50:02}', f'sub_{i % 7}')
+        os.makedirs(directory, exist_ok=True)
+        name = f'tree_model_{i}.safetensors'
+        open(os.path.join(directory, name), 'wb').close()
+        names.append(name)
+    search_paths = [root]
+
+    elapsed, _ = timed(utils.model_path, names[0], search_paths)
+    results.add('model_path.cold', elapsed * 1000, 'ms', LOWER)
+
+    picks = random.sample(names, min(args.lookups, len(names)))
+    results.add_latencies('model_path.hit', latencies(lambda name: utils.model_path(name, search_paths), picks))
+    misses = [f'missing_{i}.safetensors' for i in range(min(args.lookups, 200))]
+    results.add_latencies('model_path.miss', latencies(lambda name: utils.model_path(name, search_paths), misses))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help='smaller sizes for a fast smoke run')
+    parser.add_argument('--only', nargs='+', choices=['download', 'hashing', 'history', 'model_path'], default=None)
+    parser.add_argument('--download-size', type=parse_size, default=None)
+    parser.add_argument('--first-load-size', type=parse_size, default=parse_size('16M'))
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--bandwidth', type=parse_size, default=parse_size('64M'), help='bytes/s per connection (0 for unlimited)')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every response')
+    parser.add_argument('--failure-rate', type=float, default=0.02, help='share of requests answered with 503')
+    parser.add_argument('--drop-rate', type=float, default=0.02, help='share of transfers cut off halfway')
+    parser.add_argument('--hash-size', type=parse_size, default=None)
+    parser.add_argument('--history-entries', type=int, default=None)
+    parser.add_argument('--tree-files', type=int, default=None)
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--json', dest='json_path', default=None, help='write results to this file')
+    parser.add_argument('--baseline', default=None, help='results file from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    args.download_size = args.download_size or parse_size('64M' if args.quick else '512M')
+    args.hash_size = args.hash_size or parse_size('64M' if args.quick else '1G')
+    args.history_entries = args.history_entries or (5000 if args.quick else 50000)
+    args.tree_files = args.tree_files or (2000 if args.quick else 20000)
+    random.seed(0)
+
+    data_dir = tempfile.mkdtemp(prefix='civitai_bench_')
+    folder_paths = stubs.install(os.path.join(data_dir, 'models'))
+    load = stubs.load_package()
+    stubs.isolate_stores(load, data_dir)
+
+    benches = {
+        'download': lambda: bench_downloads(load, folder_paths, args, results),
+        'hashing': lambda: bench_hashing(load, data_dir, args, results),
+        'history': lambda: bench_history(load, data_dir, args, results),
+        'model_path': lambda: bench_model_path(load, data_dir, args, results),
+    }
+    results = Results()
+    try:
+        for name, bench in benches.items():
+            if not args.only or name in args.only:
+                bench()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as results_file:
+            json.dump(results.metrics, results_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as baseline_file:
+            regressions = results.regressions(json.load(baseline_file), args.tolerance)
+        for name, previous, current, unit in regressions:
+            print(f"REGRESSION {name}: {previous:.3f} -> {current:.3f} {unit}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
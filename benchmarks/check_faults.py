@@ -0,0 +1,186 @@
+'''
+Failure-injection checks for retries and circuit breaking, runnable without ComfyUI
+
+Drives `http_client.RetryPolicy` and full `CivitAI_Model.download()` runs
+against the local fake CivitAI server (see `fake_civitai.py`) with injected
+5xx answers, dropped transfers and a complete outage of the host:
+
+    retry_policy       API calls against a 30% failure rate all succeed
+    circuit_breaker    an outage opens the circuit, which fails fast, then a
+                       trial after the outage closes it again
+    probe_drops        probing survives transfers dropped after the headers
+    download_faults    a download completes through failures and drops
+    download_outage    a download survives an outage that opens the circuit
+
+    python benchmarks/check_faults.py
+
+Exits with status 1 if any check fails. Needs the package's own
+dependencies (`requests`, `tqdm`) installed.
+'''
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stubs  # noqa: E402
+from fake_civitai import FakeCivitAI  # noqa: E402
+
+
+MIB = 1024 ** 2
+
+
+def fast_policy(http_client, **overrides):
+    '''A process-wide retry policy with short delays, so the checks run in seconds.'''
+    options = dict(max_retries=4, base_delay=0.02, max_delay=0.2, failure_threshold=5, reset_timeout=0.5)
+    options.update(overrides)
+    http_client._retry_policy = http_client.RetryPolicy(**options)
+    return http_client._retry_policy
+
+
+def download(load, folder_paths, model, workers=4):
+    CivitAI_Model = load('CivitAI_Model').CivitAI_Model
+    checkpoints = folder_paths.folder_names_and_paths['checkpoints'][0]
+    civitai_model = CivitAI_Model(
+        model_id=model.model_id,
+        model_version=model.version_id,
+        model_types=['Checkpoint'],
+        token='check',
+        save_path=checkpoints[0],
+        model_paths=checkpoints,
+        download_chunks=workers,
+    )
+    if not civitai_model.download():
+        raise AssertionError(f"Download of {model.name} did not complete")
+    path = os.path.join(checkpoints[0], model.name)
+    if os.path.getsize(path) != model.size:
+        raise AssertionError(f"{model.name} is {os.path.getsize(path)} bytes, expected {model.size}")
+
+
+# CHECKS
+
+def check_retry_policy(load, folder_paths):
+    http_client = load('http_client')
+    policy = fast_policy(http_client, max_retries=12, failure_threshold=100)
+    with FakeCivitAI(failure_rate=0.3, seed=3) as server:
+        server.add_model(3001, 4001, 'retry.safetensors', MIB)
+        for _ in range(50):
+            response = policy.request('GET', f'{server.api}/models/3001', timeout=10)
+            if response.status_code != 200:
+                raise AssertionError(f"Request ended with status {response.status_code}")
+        if not server.stats['failures']:
+            raise AssertionError("No failures were injected")
+        return f"{server.stats['failures']} injected failures retried"
+
+
+def check_circuit_breaker(load, folder_paths):
+    http_client = load('http_client')
+    policy = fast_policy(http_client, max_retries=0)
+    with FakeCivitAI() as server:
+        server.add_model(3002, 4002, 'breaker.safetensors', MIB)
+        url = f'{server.api}/models/3002'
+        server.outage(1.0)
+        for _ in range(policy.failure_threshold):
+            policy.request('GET', url, timeout=10)
+        if policy.breaker(url).state != 'open':
+            raise AssertionError(f"Circuit is {policy.breaker(url).state} after {policy.failure_threshold} faults")
+        try:
+            policy.request('GET', url, timeout=10)
+        except http_client.CircuitOpenError:
+            pass
+        else:
+            raise AssertionError("Open circuit let a request through")
+
+        time.sleep(1.0)
+        policy.check(url, timeout=2.0)
+        response = http_client.get_session().get(url, timeout=10)
+        policy.record(url, response)
+        if response.status_code != 200 or policy.breaker(url).state != 'closed':
+            raise AssertionError(f"Trial answered {response.status_code}, circuit is {policy.breaker(url).state}")
+        return "opened during the outage and closed by the trial after it"
+
+
+def check_probe_drops(load, folder_paths):
+    http_client = load('http_client')
+    fast_policy(http_client)
+    with FakeCivitAI(drop_rate=0.5, seed=1) as server:
+        model = server.add_model(3005, 4005, 'probe.safetensors', MIB)
+        for _ in range(20):
+            result = http_client.probe(f'{server.url}/api/download/models/{model.version_id}')
+            if result.total_size != model.size or not result.accept_ranges:
+                raise AssertionError(f"Probe found size {result.total_size}, ranges {result.accept_ranges}")
+        return f"{server.stats['drops']} transfers dropped"
+
+
+def check_download_faults(load, folder_paths):
+    fast_policy(load('http_client'), failure_threshold=50)
+    with FakeCivitAI(failure_rate=0.1, drop_rate=0.1, seed=5) as server:
+        load('CivitAI_Model').CivitAI_Model.api = server.api
+        model = server.add_model(3003, 4003, 'faults.safetensors', 32 * MIB)
+        download(load, folder_paths, model)
+        return f"{server.stats['failures']} failures and {server.stats['drops']} drops injected"
+
+
+def check_download_outage(load, folder_paths):
+    policy = fast_policy(load('http_client'))
+    with FakeCivitAI(bandwidth=16 * MIB) as server:
+        load('CivitAI_Model').CivitAI_Model.api = server.api
+        model = server.add_model(3004, 4004, 'outage.safetensors', 64 * MIB)
+        # The outage starts once the chunk workers are transferring
+        outage = threading.Timer(0.5, server.outage, args=(2.0,))
+        outage.start()
+        try:
+            download(load, folder_paths, model)
+        finally:
+            outage.cancel()
+        if not server.stats['failures']:
+            raise AssertionError("Download finished before the outage started")
+        return f"completed through a 2s outage ({server.stats['failures']} requests answered 503, circuit {policy.breaker(server.url).state})"
+
+
+CHECKS = {
+    'retry_policy': check_retry_policy,
+    'circuit_breaker': check_circuit_breaker,
+    'probe_drops': check_probe_drops,
+    'download_faults': check_download_faults,
+    'download_outage': check_download_outage,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='+', choices=list(CHECKS), default=None)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='civitai_check_')
+    folder_paths = stubs.install(os.path.join(data_dir, 'models'))
+    load = stubs.load_package()
+    stubs.isolate_stores(load, data_dir)
+
+    failed = []
+    try:
+        for name, check in CHECKS.items():
+            if args.only and name not in args.only:
+                continue
+            started = time.monotonic()
+            try:
+                detail = check(load, folder_paths)
+            except Exception:
+                failed.append(name)
+                print(f"FAIL {name}")
+                traceback.print_exc()
+            else:
+                print(f"PASS {name} ({time.monotonic() - started:.1f}s): {detail}", flush=True)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
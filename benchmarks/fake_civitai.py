@@ -0,0 +1,284 @@
+'''
+Local stand-in for the CivitAI API and download CDN
+
+Serves `/api/v1/models/{id}`, `/api/v1/model-versions/by-hash/{hash}` (GET and
+the batch POST), `/api/download/models/{version_id}` (redirecting to the file
+like the real API) and ranged file downloads. File contents are synthetic and
+deterministic, so their SHA256 is known without storing them. Latency,
+per-connection bandwidth and failure injection are configurable:
+
+    server = FakeCivitAI(latency=0.02, bandwidth=50 * 1024 ** 2, failure_rate=0.05)
+    model = server.add_model(1000, 2000, 'model.safetensors', 256 * 1024 ** 2)
+    with server:
+        CivitAI_Model.api = server.api
+        ...
+'''
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+BLOCK_SIZE = 1024 * 1024
+WRITE_SIZE = 64 * 1024
+
+
+class FakeModel:
+    '''One model with a single version and file of synthetic content.'''
+
+    def __init__(self, model_id, version_id, name, size, model_type='Checkpoint'):
+        self.model_id = model_id
+        self.version_id = version_id
+        self.file_id = version_id
+        self.name = name
+        self.size = size
+        self.type = model_type
+        self.block = random.Random(model_id * 1000003 + version_id).randbytes(BLOCK_SIZE)
+        self._sha256 = None
+
+    def read(self, start, end):
+        '''Yield the bytes of the inclusive range `start`-`end`.'''
+        position = start
+        while position <= end:
+            offset = position % BLOCK_SIZE
+            length = min(BLOCK_SIZE - offset, end - position + 1, WRITE_SIZE)
+            yield self.block[offset:offset + length]
+            position += length
+
+    @property
+    def sha256(self):
+        if self._sha256 is None:
+            digest = hashlib.sha256()
+            full, rest = divmod(self.size, BLOCK_SIZE)
+            for _ in range(full):
+                digest.update(self.block)
+            digest.update(self.block[:rest])
+            self._sha256 = digest.hexdigest().upper()
+        return self._sha256
+
+    def file_details(self, base_url):
+        return {
+            'id': self.file_id,
+            'name': self.name,
+            'sizeKB': self.size / 1024,
+            'hashes': {'SHA256': self.sha256},
+            'downloadUrl': f'{base_url}/api/download/models/{self.version_id}',
+        }
+
+    def version_details(self, base_url):
+        return {
+            'id': self.version_id,
+            'modelId': self.model_id,
+            'name': f'v{self.version_id}',
+            'downloadUrl': f'{base_url}/api/download/models/{self.version_id}',
+            'trainedWords': [],
+            'model': {'name': self.name, 'type': self.type},
+            'files': [self.file_details(base_url)],
+        }
+
+    def model_details(self, base_url):
+        return {
+            'id': self.model_id,
+            'name': self.name,
+            'type': self.type,
+            'modelVersions': [self.version_details(base_url)],
+        }
+
+
+class FakeCivitAI:
+    '''
+    Threaded HTTP server emulating the CivitAI endpoints this package calls
+
+    `latency` delays every response, `bandwidth` caps each connection in
+    bytes per second, `failure_rate` answers that share of requests with
+    `failure_status` (plus `Retry-After` when `retry_after` is set) and
+    `drop_rate` cuts that share of file transfers off halfway. `outage()`
+    answers every request with `failure_status` for a while.
+    '''
+
+    def __init__(self, latency=0.0, bandwidth=0, failure_rate=0.0, failure_status=503, retry_after=None, drop_rate=0.0, seed=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.retry_after = retry_after
+        self.drop_rate = drop_rate
+        self.outage_until = 0.0
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.models = {}
+        self.by_version = {}
+        self.by_hash = {}
+        self.stats = {'requests': 0, 'failures': 0, 'drops': 0, 'bytes': 0}
+        self.stats_lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    def add_model(self, model_id, version_id, name, size, model_type='Checkpoint'):
+        model = FakeModel(model_id, version_id, name, size, model_type)
+        self.models[model_id] = model
+        self.by_version[version_id] = model
+        self.by_hash[model.sha256] = model
+        return model
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def api(self):
+        return f'{self.url}/api/v1'
+
+    def outage(self, seconds):
+        '''Fail every request from now on for `seconds`.'''
+        self.outage_until = time.monotonic() + seconds
+
+    def count(self, key, amount=1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    def chance(self, rate):
+        if not rate:
+            return False
+        with self.random_lock:
+            return self.random.random() < rate
+
+    # SERVER
+
+    def start(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-civitai', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def inject(self):
+                fake.count('requests')
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if time.monotonic() < fake.outage_until or fake.chance(fake.failure_rate):
+                    fake.count('failures')
+                    self.send_response(fake.failure_status)
+                    if fake.retry_after is not None:
+                        self.send_header('Retry-After', str(fake.retry_after))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return True
+                return False
+
+            def do_GET(self):
+                if self.inject():
+                    return
+                path = self.path.split('?')[0]
+
+                match = re.fullmatch(r'/api/v1/models/(\d+)', path)
+                if match:
+                    model = fake.models.get(int(match.group(1)))
+                    if not model:
+                        return self.send_json(404, {'error': 'Model not found'})
+                    return self.send_json(200, model.model_details(fake.url))
+
+                match = re.fullmatch(r'/api/v1/model-versions/by-hash/(\w+)', path)
+                if match:
+                    model = fake.by_hash.get(match.group(1).upper())
+                    if not model:
+                        return self.send_json(404, {'error': 'Model not found'})
+                    return self.send_json(200, model.version_details(fake.url))
+
+                match = re.fullmatch(r'/api/download/models/(\d+)', path)
+                if match:
+                    model = fake.by_version.get(int(match.group(1)))
+                    if not model:
+                        return self.send_json(404, {'error': 'Model not found'})
+                    self.send_response(307)
+                    self.send_header('Location', f'{fake.url}/files/{model.version_id}/{model.name}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                match = re.fullmatch(r'/files/(\d+)/(.+)', path)
+                if match and int(match.group(1)) in fake.by_version:
+                    return self.send_file(fake.by_version[int(match.group(1))])
+
+                self.send_json(404, {'error': 'Not found'})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if self.inject():
+                    return
+                if self.path.split('?')[0] != '/api/v1/model-versions/by-hash':
+                    return self.send_json(404, {'error': 'Not found'})
+                hashes = [str(h).upper() for h in json.loads(body or b'[]')]
+                found = [fake.by_hash[h].version_details(fake.url) for h in hashes if h in fake.by_hash]
+                self.send_json(200, found)
+
+            def send_file(self, model):
+                start, end = 0, model.size - 1
+                match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+                if match:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)) if match.group(2) else end, model.size - 1)
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{model.size}')
+                else:
+                    self.send_response(200)
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Length', str(end - start + 1))
+                self.send_header('Content-Disposition', f'attachment; filename="{model.name}"')
+                self.send_header('ETag', f'"{model.sha256[:16]}"')
+                self.end_headers()
+
+                drop_at = start + (end - start + 1) // 2 if fake.chance(fake.drop_rate) else None
+                sent = 0
+                started = time.monotonic()
+                try:
+                    for block in model.read(start, end):
+                        if drop_at is not None and start + sent >= drop_at:
+                            fake.count('drops')
+                            self.close_connection = True
+                            return
+                        self.wfile.write(block)
+                        sent += len(block)
+                        if fake.bandwidth:
+                            ahead = sent / fake.bandwidth - (time.monotonic() - started)
+                            if ahead > 0:
+                                time.sleep(ahead)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+                finally:
+                    fake.count('bytes', sent)
+
+        return Handler
@@ -0,0 +1,109 @@
+'''
+Stand-ins for the ComfyUI modules this package imports, so benchmarks run
+without a ComfyUI checkout
+
+`install(models_root)` registers minimal `comfy`, `comfy.sd`, `comfy.utils`,
+`nodes` and `folder_paths` modules, with `checkpoints` and `loras` folders under
+`models_root`. `load_package()` then imports package modules through a bare
+package alias, without running `__init__.py`, the same way `cli.py` does.
+'''
+import importlib
+import os
+import sys
+import types
+
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = 'civitai_comfy_nodes_bench'
+
+SUPPORTED_PT_EXTENSIONS = {'.ckpt', '.pt', '.bin', '.pth', '.safetensors'}
+
+
+class ProgressBar:
+    def __init__(self, total):
+        self.total = total
+        self.current = 0
+
+    def update_absolute(self, value, total=None, preview=None):
+        if total is not None:
+            self.total = total
+        self.current = value
+
+    def update(self, value):
+        self.update_absolute(self.current + value)
+
+
+def make_folder_paths(models_root):
+    folder_paths = types.ModuleType('folder_paths')
+    folder_paths.models_dir = models_root
+    folder_paths.supported_pt_extensions = SUPPORTED_PT_EXTENSIONS
+    folder_paths.folder_names_and_paths = {
+        folder: ([os.path.join(models_root, folder)], SUPPORTED_PT_EXTENSIONS)
+        for folder in ('checkpoints', 'loras')
+    }
+    for paths, _ in folder_paths.folder_names_and_paths.values():
+        os.makedirs(paths[0], exist_ok=True)
+
+    def get_filename_list(folder):
+        paths, extensions = folder_paths.folder_names_and_paths[folder]
+        names = []
+        for path in paths:
+            for root, _, files in os.walk(path):
+                for name in files:
+                    if os.path.splitext(name)[1] in extensions:
+                        names.append(os.path.relpath(os.path.join(root, name), path))
+        return sorted(names)
+
+    def get_full_path(folder, filename):
+        for path in folder_paths.folder_names_and_paths[folder][0]:
+            full_path = os.path.join(path, filename)
+            if os.path.isfile(full_path):
+                return full_path
+        return None
+
+    folder_paths.get_filename_list = get_filename_list
+    folder_paths.get_full_path = get_full_path
+    return folder_paths
+
+
+def install(models_root):
+    comfy = types.ModuleType('comfy')
+    comfy_sd = types.ModuleType('comfy.sd')
+    comfy_utils = types.ModuleType('comfy.utils')
+    comfy_utils.ProgressBar = ProgressBar
+    comfy.sd = comfy_sd
+    comfy.utils = comfy_utils
+
+    nodes = types.ModuleType('nodes')
+    nodes.CheckpointLoaderSimple = type('CheckpointLoaderSimple', (), {})
+    nodes.LoraLoader = type('LoraLoader', (), {})
+
+    sys.modules.update({
+        'comfy': comfy,
+        'comfy.sd': comfy_sd,
+        'comfy.utils': comfy_utils,
+        'nodes': nodes,
+        'folder_paths': make_folder_paths(models_root),
+    })
+    return sys.modules['folder_paths']
+
+
+def load_package():
+    if PACKAGE_NAME not in sys.modules:
+        package = types.ModuleType(PACKAGE_NAME)
+        package.__path__ = [PACKAGE_DIR]
+        sys.modules[PACKAGE_NAME] = package
+    return lambda name: importlib.import_module(f'{PACKAGE_NAME}.{name}')
+
+
+def isolate_stores(load, data_dir):
+    '''Point the history, hash and API caches at `data_dir` instead of the package directory.'''
+    download_history = load('download_history')
+    hash_cache = load('hash_cache')
+    api_cache = load('api_cache')
+    download_history._download_history = download_history.DownloadHistory(
+        os.path.join(data_dir, 'download_history.db'),
+        os.path.join(data_dir, 'download_history.json'),
+    )
+    hash_cache._hash_cache = hash_cache.HashCache(os.path.join(data_dir, 'hash_cache.db'))
+    api_cache._api_cache = api_cache.ApiCache(os.path.join(data_dir, 'api_cache.db'))
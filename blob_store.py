@@ -0,0 +1,121 @@
+import os
+import threading
+
+
+LINK_HARDLINK = 'hardlink'
+LINK_SYMLINK = 'symlink'
+
+
+class BlobStore:
+    '''
+    Optional content-addressed store for model files
+
+    Each file is kept once as `<root>/sha256/<AB>/<SHA256>` and exposed under
+    its expected name in a model folder through a hardlink (falling back to a
+    symlink across filesystems) or a symlink, so identical files downloaded
+    under different names or into several roots share one copy on disk.
+    '''
+
+    def __init__(self, root, link_mode=LINK_HARDLINK):
+        self.root = os.path.abspath(root)
+        self.link_mode = link_mode if link_mode in (LINK_HARDLINK, LINK_SYMLINK) else LINK_HARDLINK
+
+    def path_for(self, sha256):
+        sha256 = sha256.upper()
+        return os.path.join(self.root, 'sha256', sha256[:2], sha256)
+
+    def has(self, sha256):
+        if not sha256:
+            return False
+        path = self.path_for(sha256)
+        return os.path.isfile(path) and os.path.getsize(path) > 0
+
+    def prepare(self, sha256):
+        path = self.path_for(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    # MATERIALIZE A BLOB UNDER A MODEL NAME
+
+    def materialize(self, sha256, dest_path):
+        '''
+        Atomically replace `dest_path` with a link to the blob. Returns the link
+        type that was created.
+        '''
+        blob_path = self.path_for(sha256)
+        temp_path = f'{dest_path}.link.tmp'
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+
+        link_type = self.link_mode
+        if link_type == LINK_HARDLINK:
+            try:
+                os.link(blob_path, temp_path)
+            except OSError:
+                # Different filesystem or no hardlink support
+                link_type = LINK_SYMLINK
+        if link_type == LINK_SYMLINK:
+            os.symlink(blob_path, temp_path)
+
+        os.replace(temp_path, dest_path)
+        return link_type
+
+    # RECLAIM A BLOB
+
+    def linked_sha256(self, path):
+        '''The SHA256 of the blob `path` is a symlink to, or None.'''
+        if not os.path.islink(path):
+            return None
+        target = os.path.realpath(path)
+        if os.path.dirname(os.path.dirname(target)) != os.path.join(os.path.realpath(self.root), 'sha256'):
+            return None
+        return os.path.basename(target)
+
+    def release(self, sha256, link_paths=()):
+        '''
+        Remove a blob nothing refers to anymore: it has no hardlink besides its
+        own path and none of `link_paths` is a symlink to it. Symlinks can't be
+        counted from the blob, so callers pass every model path that may still
+        link to it. Returns True if the blob was removed.
+        '''
+        blob_path = self.path_for(sha256)
+        try:
+            if os.stat(blob_path).st_nlink > 1:
+                return False
+        except OSError:
+            return False
+        real_blob_path = os.path.realpath(blob_path)
+        for link_path in link_paths:
+            if os.path.islink(link_path) and os.path.realpath(link_path) == real_blob_path:
+                return False
+        os.remove(blob_path)
+        return True
+
+    def links_to(self, sha256, path):
+        '''True if `path` already is a link to this blob.'''
+        if not os.path.lexists(path):
+            return False
+        blob_path = self.path_for(sha256)
+        try:
+            return os.path.samefile(path, blob_path)
+        except OSError:
+            return False
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    '''
+    The configured store, or None when `CIVITAI_BLOB_STORE` is not set.
+    `CIVITAI_BLOB_LINK` selects `hardlink` (default) or `symlink`.
+    '''
+    global _blob_store
+    root = os.environ.get('CIVITAI_BLOB_STORE')
+    if not root:
+        return None
+    if _blob_store is None or _blob_store.root != os.path.abspath(root):
+        with _blob_store_lock:
+            _blob_store = BlobStore(root, os.environ.get('CIVITAI_BLOB_LINK', LINK_HARDLINK))
+    return _blob_store
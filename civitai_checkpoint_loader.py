@@ -1,23 +1,9 @@
-import hashlib
-import json
-import os
-import requests
-import sys
-import time
-from tqdm import tqdm
-
 import folder_paths
-import comfy.sd
-import comfy.utils
-from nodes import CheckpointLoaderSimple
-
-from .CivitAI_Model import CivitAI_Model
-from .utils import short_paths_map, model_path
 
+from .metrics import timer
+from .prefetch import wait as wait_for_prefetch
+from .utils import folder_roots, short_paths_map, model_path, parse_air
 
-ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
-CHECKPOINT_PATH = folder_paths.folder_names_and_paths["checkpoints"][0][0]
-CHECKPOINTS = folder_paths.folder_names_and_paths["checkpoints"][0]
 
 MSG_PREFIX = '\33[1m\33[34m[CivitAI] \33[0m'
 
@@ -32,7 +18,7 @@ class CivitAI_Checkpoint_Loader:
     def INPUT_TYPES(cls):
         checkpoints = folder_paths.get_filename_list("checkpoints")
         checkpoints.insert(0, 'none')
-        checkpoint_paths = short_paths_map(CHECKPOINTS)
+        checkpoint_paths = short_paths_map(folder_roots("checkpoints"))
         
         return {
             "required": {
@@ -56,6 +42,13 @@ class CivitAI_Checkpoint_Loader:
 
     def load_checkpoint(self, ckpt_air, ckpt_name, api_key=None, download_chunks=None, download_path=None, extra_pnginfo=None):
 
+        from nodes import CheckpointLoaderSimple
+        from .CivitAI_Model import CivitAI_Model
+        from .disk_quota import model_in_use, record_model_use
+        from .model_pool import get_model_pool
+
+        model_roots = folder_roots("checkpoints")
+
         if extra_pnginfo and 'workflow' in extra_pnginfo:
             extra_pnginfo['workflow']['extra'].setdefault('ckpt_airs', [])
 
@@ -64,30 +57,25 @@ class CivitAI_Checkpoint_Loader:
             
         if ckpt_name == 'none':
         
-            ckpt_id = None
-            version_id = None
-            
-            if '@' in ckpt_air:
-                ckpt_id, version_id = ckpt_air.split('@')
-            else:
-                ckpt_id = ckpt_air
-                
-            ckpt_id = int(ckpt_id) if ckpt_id else None
-            version_id = int(version_id) if version_id else None
+            ckpt_id, version_id = parse_air(ckpt_air)
+
+            wait_for_prefetch('checkpoints', ckpt_id, version_id)
             
-            checkpoint_paths = short_paths_map(CHECKPOINTS)
+            checkpoint_paths = short_paths_map(model_roots)
             if download_path:
                 if checkpoint_paths.__contains__(download_path):
                     download_path = checkpoint_paths[download_path]
                 else:
-                    download_path = CHECKPOINTS[0]
+                    download_path = model_roots[0]
             
-            civitai_model = CivitAI_Model(model_id=ckpt_id, model_version=version_id, model_types=["Checkpoint",], token=api_key, save_path=download_path, model_paths=CHECKPOINTS, download_chunks=download_chunks)
+            civitai_model = CivitAI_Model(model_id=ckpt_id, model_version=version_id, model_types=["Checkpoint",], token=api_key, save_path=download_path, model_paths=model_roots, download_chunks=download_chunks)
                 
             if not civitai_model.download():
                return None, None, None 
                
             ckpt_name = civitai_model.name
+            ckpt_path = model_path(ckpt_name, model_roots)
+            model_id, version_id = civitai_model.model_id, civitai_model.version
             if extra_pnginfo and 'workflow' in extra_pnginfo:
                 air = f'{civitai_model.model_id}@{civitai_model.version}'
                 if air not in extra_pnginfo['workflow']['extra']['ckpt_airs']: 
@@ -95,9 +83,10 @@ class CivitAI_Checkpoint_Loader:
                     
         else:
         
-            ckpt_path = model_path(ckpt_name, CHECKPOINTS)
+            # `ckpt_name` is relative to a checkpoints root and may include a subfolder
+            ckpt_path = folder_paths.get_full_path('checkpoints', ckpt_name)
 
-            model_id, version_id, details = CivitAI_Model.sha256_lookup(ckpt_path)
+            model_id, version_id, details = CivitAI_Model.sha256_lookup(ckpt_path) if ckpt_path else (None, None, None)
             
             if model_id and version_id and extra_pnginfo and 'workflow' in extra_pnginfo:
                 air = f'{model_id}@{version_id}'
@@ -106,6 +95,16 @@ class CivitAI_Checkpoint_Loader:
             
             print(f"{MSG_PREFIX}Loading checkpoint from disk: {ckpt_path}")
         
-        out = self.ckpt_loader.load_checkpoint(ckpt_name=ckpt_name)
+        # Recently used checkpoints stay loaded, up to the pool's RAM budget
+        pool = get_model_pool('checkpoints')
+        sha256 = CivitAI_Model.calculate_sha256(ckpt_path) if pool.enabled else None
+        out = pool.get(sha256)
+        if out is not None:
+            print(f"{MSG_PREFIX}Using warm checkpoint from pool: {ckpt_name}")
+        else:
+            with model_in_use(ckpt_path), timer('phase', phase='load', folder='checkpoints'):
+                out = self.ckpt_loader.load_checkpoint(ckpt_name=ckpt_name)[:3]
+            pool.put(sha256, out)
+        record_model_use(ckpt_path, 'checkpoints', model_id, version_id)
         
         return out[0], out[1], out[2], { "extra_pnginfo": extra_pnginfo }
@@ -1,25 +1,30 @@
-import hashlib
-import json
-import os
-import requests
-import sys
-import time
-from tqdm import tqdm
-
 import folder_paths
-import comfy.utils
-from nodes import LoraLoader
 
-from .CivitAI_Model import CivitAI_Model
-from .utils import short_paths_map, model_path
+from .metrics import timer
+from .prefetch import wait as wait_for_prefetch
+from .utils import folder_roots, short_paths_map, model_path, parse_air
 
 
-ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
-LORA_PATH = folder_paths.folder_names_and_paths["loras"][0][0]
-LORAS = folder_paths.folder_names_and_paths["loras"][0]
+LORA_POOL_DEFAULT = '1G'
 
 MSG_PREFIX = '\33[1m\33[34m[CivitAI] \33[0m'
 
+def load_lora_tensors(lora_path):
+    '''Parsed LoRA state dict, from the LoRA pool when it is already loaded.'''
+    import comfy.utils
+    from .CivitAI_Model import CivitAI_Model
+    from .disk_quota import model_in_use
+    from .model_pool import get_model_pool
+
+    pool = get_model_pool('loras', default=LORA_POOL_DEFAULT)
+    sha256 = CivitAI_Model.calculate_sha256(lora_path) if pool.enabled else None
+    lora = pool.get(sha256)
+    if lora is None:
+        with model_in_use(lora_path), timer('phase', phase='load', folder='loras'):
+            lora = comfy.utils.load_torch_file(lora_path, safe_load=True)
+        pool.put(sha256, lora)
+    return lora
+
 class CivitAI_LORA_Loader:
     """
         Implements the CivitAI LORA Loader node for ComfyUI 
@@ -31,7 +36,7 @@ class CivitAI_LORA_Loader:
     def INPUT_TYPES(cls):
         loras = folder_paths.get_filename_list("loras")
         loras.insert(0, 'none')
-        lora_paths = short_paths_map(LORAS)
+        lora_paths = short_paths_map(folder_roots("loras"))
         
         return {
             "required": {
@@ -60,6 +65,14 @@ class CivitAI_LORA_Loader:
 
     def load_lora(self, model, clip, lora_air, lora_name, strength_model, strength_clip, api_key=None, download_chunks=None, download_path=None, extra_pnginfo=None):
 
+        import comfy.sd
+        from nodes import LoraLoader
+        from .CivitAI_Model import CivitAI_Model
+        from .disk_quota import model_in_use, record_model_use
+        from .model_pool import get_model_pool
+
+        model_roots = folder_roots("loras")
+
         if extra_pnginfo and 'workflow' in extra_pnginfo:
             extra_pnginfo['workflow']['extra'].setdefault('lora_airs', [])
 
@@ -68,30 +81,25 @@ class CivitAI_LORA_Loader:
             
         if lora_name == 'none':
         
-            lora_id = None
-            version_id = None
-            
-            if '@' in lora_air:
-                lora_id, version_id = lora_air.split('@')
-            else:
-                lora_id = lora_air
-                
-            lora_id = int(lora_id) if lora_id else None
-            version_id = int(version_id) if version_id else None
+            lora_id, version_id = parse_air(lora_air)
+
+            wait_for_prefetch('loras', lora_id, version_id)
             
-            lora_paths = short_paths_map(LORAS)
+            lora_paths = short_paths_map(model_roots)
             if download_path:
                 if lora_paths.__contains__(download_path):
                     download_path = lora_paths[download_path]
                 else:
-                    download_path = LORAS[0] 
+                    download_path = model_roots[0] 
             
-            civitai_model = CivitAI_Model(model_id=lora_id, model_version=version_id, model_types=["LORA", "LoCon"], token=api_key, save_path=download_path, model_paths=LORAS, download_chunks=download_chunks)
+            civitai_model = CivitAI_Model(model_id=lora_id, model_version=version_id, model_types=["LORA", "LoCon"], token=api_key, save_path=download_path, model_paths=model_roots, download_chunks=download_chunks)
                 
             if not civitai_model.download():
                return model, clip 
                
             lora_name = civitai_model.name
+            lora_path = model_path(lora_name, model_roots)
+            model_id, version_id = civitai_model.model_id, civitai_model.version
             if extra_pnginfo and 'workflow' in extra_pnginfo:
                 air = f'{civitai_model.model_id}@{civitai_model.version}'
                 if air not in extra_pnginfo['workflow']['extra']['lora_airs']: 
@@ -99,9 +107,10 @@ class CivitAI_LORA_Loader:
                     
         else:
         
-            lora_path = model_path(lora_name, LORAS)
+            # `lora_name` is relative to a loras root and may include a subfolder
+            lora_path = folder_paths.get_full_path('loras', lora_name)
             
-            model_id, version_id, details = CivitAI_Model.sha256_lookup(lora_path)
+            model_id, version_id, details = CivitAI_Model.sha256_lookup(lora_path) if lora_path else (None, None, None)
             
             if model_id and version_id and extra_pnginfo and 'workflow' in extra_pnginfo:
                 air = f'{model_id}@{version_id}'
@@ -110,6 +119,18 @@ class CivitAI_LORA_Loader:
             
             print(f"{MSG_PREFIX}Loading LORA from disk: {lora_path}")
         
-        model_lora, clip_lora = self.lora_loader.load_lora(model, clip, lora_name, strength_model, strength_clip)
+        # Parsed LoRA tensors are pooled by SHA256, so a new strength or base model only costs the patch
+        pool = get_model_pool('loras', default=LORA_POOL_DEFAULT)
+        if not pool.enabled or not lora_path:
+            # Without a resolved path, ComfyUI's own loader looks the name up
+            with model_in_use(lora_path), timer('phase', phase='load', folder='loras'):
+                model_lora, clip_lora = self.lora_loader.load_lora(model, clip, lora_name, strength_model, strength_clip)
+        elif strength_model == 0 and strength_clip == 0:
+            model_lora, clip_lora = model, clip
+        else:
+            lora = load_lora_tensors(lora_path)
+            with timer('phase', phase='patch', folder='loras'):
+                model_lora, clip_lora = comfy.sd.load_lora_for_models(model, clip, lora, strength_model, strength_clip)
+        record_model_use(lora_path, 'loras', model_id, version_id)
 
         return model_lora, clip_lora, { "extra_pnginfo": extra_pnginfo }
@@ -0,0 +1,121 @@
+import concurrent.futures
+
+from .civitai_lora_loader import load_lora_tensors
+from .metrics import timer
+from .prefetch import wait as wait_for_prefetch
+from .utils import folder_roots, short_paths_map, model_path, parse_air, parse_lora_stack
+
+
+MAX_RESOLVE_WORKERS = 8
+
+MSG_PREFIX = '\33[1m\33[34m[CivitAI] \33[0m'
+WARN_PREFIX = '\33[1m\33[34m[CivitAI]\33[0m\33[93m Warning: \33[0m'
+ERR_PREFIX = '\33[1m\33[31m[CivitAI]\33[0m\33[1m Error: \33[0m'
+
+class CivitAI_Lora_Stack:
+    """
+        Implements the CivitAI LORA Stack node for ComfyUI
+
+        Applies a list of `air:strength_model:strength_clip` entries in one node.
+        Every AIR is resolved, downloaded and parsed concurrently before the
+        patches are applied in order.
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        lora_paths = short_paths_map(folder_roots("loras"))
+
+        return {
+            "required": {
+                "model": ("MODEL",),
+                "clip": ("CLIP", ),
+                "lora_stack": ("STRING", {"default": "# {model_id}@{model_version}:{strength_model}:{strength_clip}", "multiline": True}),
+            },
+            "optional": {
+                "api_key": ("STRING", {"default": "", "multiline": False}),
+                "download_chunks": ("INT", {"default": 4, "min": 1, "max": 12, "step": 1}),
+                "download_path": (list(lora_paths),),
+            },
+            "hidden": {
+                "extra_pnginfo": "EXTRA_PNGINFO"
+            }
+        }
+
+    RETURN_TYPES = ("MODEL", "CLIP")
+    FUNCTION = "load_lora_stack"
+
+    CATEGORY = "CivitAI/Loaders"
+
+    # RESOLVE, DOWNLOAD AND PARSE ONE AIR
+
+    @staticmethod
+    def fetch(air, api_key=None, download_chunks=None, download_path=None):
+        from .CivitAI_Model import CivitAI_Model
+
+        lora_id, version_id = parse_air(air)
+
+        wait_for_prefetch('loras', lora_id, version_id)
+
+        civitai_model = CivitAI_Model(model_id=lora_id, model_version=version_id, model_types=["LORA", "LoCon"], token=api_key, save_path=download_path, model_paths=folder_roots("loras"), download_chunks=download_chunks)
+        if not civitai_model.download():
+            raise Exception(f"{ERR_PREFIX}Unable to download LORA `{air}`.")
+
+        lora_path = model_path(civitai_model.name, folder_roots("loras"))
+        return civitai_model, lora_path, load_lora_tensors(lora_path)
+
+    def load_lora_stack(self, model, clip, lora_stack, api_key=None, download_chunks=None, download_path=None, extra_pnginfo=None):
+
+        import comfy.sd
+        from .disk_quota import record_model_use
+
+        if extra_pnginfo and 'workflow' in extra_pnginfo:
+            extra_pnginfo['workflow']['extra'].setdefault('lora_airs', [])
+
+        model_roots = folder_roots("loras")
+        lora_paths = short_paths_map(model_roots)
+        if download_path:
+            download_path = lora_paths.get(download_path, model_roots[0])
+        else:
+            download_path = model_roots[0]
+
+        try:
+            entries = parse_lora_stack(lora_stack)
+        except ValueError as e:
+            raise Exception(f"{ERR_PREFIX}{e}")
+
+        # Each AIR is fetched once; a repeated AIR keeps its first strengths
+        stack = {}
+        for air, strength_model, strength_clip in entries:
+            if parse_air(air) in stack:
+                print(f"{WARN_PREFIX}LORA `{air}` is listed more than once in the stack, only the first entry is applied")
+                continue
+            stack[parse_air(air)] = (air, strength_model, strength_clip)
+
+        if not stack:
+            return model, clip, { "extra_pnginfo": extra_pnginfo }
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(MAX_RESOLVE_WORKERS, len(stack))) as executor:
+            futures = {
+                key: executor.submit(self.fetch, air, api_key, download_chunks, download_path)
+                for key, (air, _, _) in stack.items()
+            }
+            fetched = {key: future.result() for key, future in futures.items()}
+
+        # Patches are only recorded here; the weights are patched once when the model is loaded
+        model_lora, clip_lora = model, clip
+        with timer('phase', phase='patch', folder='loras'):
+            for key, (air, strength_model, strength_clip) in stack.items():
+                civitai_model, lora_path, lora = fetched[key]
+                if strength_model == 0 and strength_clip == 0:
+                    continue
+                print(f"{MSG_PREFIX}Applying LORA `{civitai_model.name}` ({strength_model}, {strength_clip})")
+                model_lora, clip_lora = comfy.sd.load_lora_for_models(model_lora, clip_lora, lora, strength_model, strength_clip)
+
+        for key, (civitai_model, lora_path, _) in fetched.items():
+            record_model_use(lora_path, 'loras', civitai_model.model_id, civitai_model.version)
+            if extra_pnginfo and 'workflow' in extra_pnginfo:
+                air = f'{civitai_model.model_id}@{civitai_model.version}'
+                if air not in extra_pnginfo['workflow']['extra']['lora_airs']:
+                    extra_pnginfo['workflow']['extra']['lora_airs'].append(air)
+
+        return model_lora, clip_lora, { "extra_pnginfo": extra_pnginfo }
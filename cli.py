@@ -0,0 +1,126 @@
+'''
+Headless entry points for the CivitAI nodes
+
+Run from anywhere with ComfyUI installed, e.g.
+
+    python custom_nodes/civitai_comfy_nodes/cli.py index
+    python custom_nodes/civitai_comfy_nodes/cli.py index --folders checkpoints --api http://127.0.0.1:8080/api/v1
+    python custom_nodes/civitai_comfy_nodes/cli.py sync models.txt --workers 4
+
+The package is loaded without registering its nodes, so only the modules a
+command needs are imported.
+'''
+import argparse
+import importlib
+import os
+import sys
+import types
+
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_NAME = 'civitai_comfy_nodes_cli'
+
+
+def load_package(comfyui_path, extra_model_paths=None):
+    if comfyui_path not in sys.path:
+        sys.path.insert(0, comfyui_path)
+
+    if extra_model_paths:
+        try:
+            from utils.extra_config import load_extra_path_config
+        except ImportError:
+            from main import load_extra_path_config
+        load_extra_path_config(extra_model_paths)
+
+    # Bare package module: submodules resolve their relative imports without running __init__.py
+    if PACKAGE_NAME not in sys.modules:
+        package = types.ModuleType(PACKAGE_NAME)
+        package.__path__ = [PACKAGE_DIR]
+        sys.modules[PACKAGE_NAME] = package
+    return lambda name: importlib.import_module(f'{PACKAGE_NAME}.{name}')
+
+
+# COMMANDS
+
+def command_index(args, load):
+    library_indexer = load('library_indexer')
+    if args.api:
+        load('CivitAI_Model').CivitAI_Model.api = args.api.rstrip('/')
+    library_indexer.index_library(
+        folders=tuple(args.folders),
+        workers=args.workers,
+        processes=not args.threads,
+        batch_size=args.batch_size,
+        api=args.api,
+        refresh=args.refresh,
+    )
+    return 0
+
+
+def command_pin(args, load):
+    disk_quota = load('disk_quota')
+    for air in args.airs:
+        if args.command == 'unpin':
+            disk_quota.unpin_air(air)
+        else:
+            disk_quota.pin_air(air)
+    pinned = sorted(load('download_history').get_download_history().pinned_airs())
+    print(f"Pinned AIRs: {', '.join(pinned) if pinned else 'none'}")
+    return 0
+
+
+def command_sync(args, load):
+    manifest_sync = load('manifest_sync')
+    if args.api:
+        load('CivitAI_Model').CivitAI_Model.api = args.api.rstrip('/')
+    summary = manifest_sync.sync_manifest(
+        args.manifest,
+        token=args.api_key or os.environ.get('CIVITAI_API_KEY'),
+        workers=args.workers,
+        download_chunks=args.download_chunks,
+        pin=args.pin,
+        dry_run=args.dry_run,
+    )
+    return 1 if summary['failed'] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='cli.py', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comfyui-path', default=os.path.dirname(os.path.dirname(PACKAGE_DIR)), help='ComfyUI root directory')
+    parser.add_argument('--extra-model-paths-config', default=None, help='extra_model_paths.yaml to load')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    index = commands.add_parser('index', help='hash and identify every model in the library')
+    index.add_argument('--folders', nargs='+', default=['checkpoints', 'loras'])
+    index.add_argument('--workers', type=int, default=None)
+    index.add_argument('--threads', action='store_true', help='hash with threads instead of processes')
+    index.add_argument('--batch-size', type=int, default=100)
+    index.add_argument('--api', default=None, help='CivitAI API base URL, or a local stand-in')
+    index.add_argument('--refresh', action='store_true', help='re-check hashes previously unknown to CivitAI')
+    index.set_defaults(handler=command_index)
+
+    pin = commands.add_parser('pin', help='protect models from disk quota eviction')
+    pin.add_argument('airs', nargs='*', help='`model_id` or `model_id@version_id`')
+    pin.set_defaults(handler=command_pin)
+
+    unpin = commands.add_parser('unpin', help='allow pinned models to be evicted again')
+    unpin.add_argument('airs', nargs='+')
+    unpin.set_defaults(handler=command_pin)
+
+    sync = commands.add_parser('sync', help='download every model in a manifest of AIRs that is not on disk yet')
+    sync.add_argument('manifest', help='text file of `<type> <air>` lines, or a JSON manifest')
+    sync.add_argument('--workers', type=int, default=4, help='models downloaded at the same time')
+    sync.add_argument('--download-chunks', type=int, default=None, help='connections per model download')
+    sync.add_argument('--api-key', default=None, help='CivitAI API key (default: $CIVITAI_API_KEY)')
+    sync.add_argument('--api', default=None, help='CivitAI API base URL, or a local stand-in')
+    sync.add_argument('--pin', action='store_true', help='also pin every manifest model against disk quota eviction')
+    sync.add_argument('--dry-run', action='store_true', help='only report what would be downloaded')
+    sync.set_defaults(handler=command_sync)
+
+    args = parser.parse_args(argv)
+    load = load_package(os.path.abspath(args.comfyui_path), args.extra_model_paths_config)
+    return args.handler(args, load)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
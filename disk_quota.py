@@ -0,0 +1,214 @@
+import contextlib
+import os
+import shutil
+import threading
+
+import folder_paths
+
+from .blob_store import get_blob_store
+from .download_history import get_download_history
+from .download_lock import ModelFileLock
+from .hash_cache import get_hash_cache
+from .model_index import forget_file
+from .utils import parse_size
+
+
+MSG_PREFIX = '\33[1m\33[34m[CivitAI] \33[0m'
+ERR_PREFIX = '\33[1m\33[31m[CivitAI]\33[0m\33[1m Error: \33[0m'
+
+POLICY_LRU = 'lru'
+POLICY_LFU = 'lfu'
+
+
+# FILES IN USE BY A RUNNING LOAD
+
+_in_use = {}
+_in_use_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def model_in_use(path):
+    '''
+    Mark a model file as in use for the duration of a load. Eviction skips it,
+    in this process through a refcount and in others through a shared lock.
+    '''
+    if not path:
+        yield
+        return
+    path = os.path.abspath(path)
+    with _in_use_lock:
+        _in_use[path] = _in_use.get(path, 0) + 1
+    lock = ModelFileLock(path, shared=True)
+    try:
+        lock.acquire()
+    except OSError:
+        lock = None
+    try:
+        yield
+    finally:
+        if lock:
+            lock.release()
+        with _in_use_lock:
+            _in_use[path] -= 1
+            if not _in_use[path]:
+                del _in_use[path]
+
+
+def is_in_use(path):
+    with _in_use_lock:
+        return os.path.abspath(path) in _in_use
+
+
+# QUOTAS
+
+class DiskQuota:
+    '''
+    Per-folder-type quotas with LRU or LFU eviction of downloaded models
+
+    Only files this package downloaded are ever evicted, least recently (or
+    least frequently) loaded first. Files whose AIR is pinned, or that a
+    running load holds, are never touched. Quotas come from
+    `CIVITAI_QUOTA_<FOLDER>` (e.g. `CIVITAI_QUOTA_CHECKPOINTS=200G`), the
+    policy from `CIVITAI_EVICTION_POLICY` and the free space to keep on every
+    disk from `CIVITAI_MIN_FREE_BYTES`.
+    '''
+
+    def __init__(self, policy=None, min_free_bytes=None):
+        self.policy = (policy or os.environ.get('CIVITAI_EVICTION_POLICY') or POLICY_LRU).lower()
+        self.min_free_bytes = parse_size(min_free_bytes if min_free_bytes is not None else os.environ.get('CIVITAI_MIN_FREE_BYTES')) or 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def quota(folder):
+        if not folder:
+            return None
+        return parse_size(os.environ.get(f'CIVITAI_QUOTA_{folder.upper()}'))
+
+    @staticmethod
+    def folder_for_paths(model_paths):
+        '''The `folder_paths` folder type whose roots are `model_paths`.'''
+        for folder, (paths, _) in folder_paths.folder_names_and_paths.items():
+            if list(paths) == list(model_paths):
+                return folder
+        return None
+
+    # CANDIDATES
+
+    def candidates(self, folder=None, device=None, exclude=()):
+        history = get_download_history()
+        pinned = history.pinned_airs()
+        rows = []
+        for path, row_folder, model_id, version_id, size, last_used, use_count in history.downloaded_files(folder):
+            if path in exclude or not os.path.exists(path):
+                continue
+            if model_id and (str(model_id) in pinned or f'{model_id}@{version_id}' in pinned):
+                continue
+            if is_in_use(path):
+                continue
+            if device is not None and os.stat(path).st_dev != device:
+                continue
+            rows.append((path, size or os.path.getsize(path), last_used, use_count))
+
+        if self.policy == POLICY_LFU:
+            rows.sort(key=lambda row: (row[3], row[2]))
+        else:
+            rows.sort(key=lambda row: row[2])
+        return rows
+
+    def folder_usage(self, folder):
+        return sum(
+            os.path.getsize(path)
+            for path, *_ in get_download_history().downloaded_files(folder)
+            if os.path.exists(path)
+        )
+
+    # EVICTION
+
+    def evict(self, path):
+        '''
+        Remove one downloaded model unless another process is loading it.
+        Returns True if the file was removed.
+        '''
+        lock = ModelFileLock(path)
+        if not lock.acquire_nowait():
+            return False
+        try:
+            # Resolved before removing it; a symlink names its blob, a hardlink is found by its hash
+            blob_store = get_blob_store()
+            sha256 = (blob_store and blob_store.linked_sha256(path)) or get_hash_cache().get(path)
+            linked = bool(blob_store and sha256 and blob_store.links_to(sha256, path))
+            os.remove(path)
+            # A blob-store file that no other model hardlinks or symlinks to goes with it
+            if linked:
+                others = [other for other, *_ in get_download_history().downloaded_files() if other != path]
+                blob_store.release(sha256, others)
+        finally:
+            lock.release()
+        get_download_history().forget_use(path)
+        forget_file(path)
+        print(f"{MSG_PREFIX}Evicted `{os.path.basename(path)}` to free disk space")
+        return True
+
+    def make_room(self, directory, needed_bytes, folder=None, exclude=()):
+        '''
+        Make sure `needed_bytes` fit in `folder`'s quota and on the disk holding
+        `directory`, evicting downloaded models as needed. Raises when the space
+        cannot be found, before anything is preallocated.
+        '''
+        with self.lock:
+            quota = self.quota(folder)
+            if quota is not None:
+                if needed_bytes > quota:
+                    raise Exception(f"{ERR_PREFIX}File needs {needed_bytes} bytes, more than the `{folder}` quota of {quota} bytes.")
+                over = self.folder_usage(folder) + needed_bytes - quota
+                for path, size, *_ in self.candidates(folder, exclude=exclude):
+                    if over <= 0:
+                        break
+                    if self.evict(path):
+                        over -= size
+                if over > 0:
+                    raise Exception(f"{ERR_PREFIX}Unable to free enough of the `{folder}` quota for a {needed_bytes} byte download.")
+
+            free = shutil.disk_usage(directory).free - self.min_free_bytes
+            if free >= needed_bytes:
+                return
+            device = os.stat(directory).st_dev
+            for path, size, *_ in self.candidates(device=device, exclude=exclude):
+                if free >= needed_bytes:
+                    break
+                self.evict(path)
+                free = shutil.disk_usage(directory).free - self.min_free_bytes
+            if free < needed_bytes:
+                raise Exception(f"{ERR_PREFIX}Not enough disk space in `{directory}`: {needed_bytes} bytes needed, {max(free, 0)} available.")
+
+
+_disk_quota = None
+
+
+def get_disk_quota():
+    global _disk_quota
+    if _disk_quota is None:
+        _disk_quota = DiskQuota()
+    return _disk_quota
+
+
+# USAGE
+
+def record_model_use(path, folder=None, model_id=None, version_id=None, downloaded=False, used=True):
+    '''Record a load (or download) of `path` in the metadata history for eviction.'''
+    if not path or not os.path.exists(path):
+        return
+    get_download_history().record_use(
+        os.path.abspath(path), folder=folder, model_id=model_id, version_id=version_id,
+        size=os.path.getsize(path), downloaded=downloaded, used=used,
+    )
+
+
+# PINS
+
+def pin_air(air):
+    get_download_history().pin(air)
+
+
+def unpin_air(air):
+    get_download_history().unpin(air)
@@ -0,0 +1,108 @@
+import contextlib
+import itertools
+import os
+import threading
+import time
+
+
+# Lower values are served first
+PRIORITY_FOREGROUND = 0
+PRIORITY_PREFETCH = 10
+
+
+class DownloadBudget:
+    '''
+    Process-wide connection and bandwidth budget shared by every download
+
+    Chunk workers hold a connection slot for each range they fetch; slots are
+    granted to the waiting worker with the best (lowest) priority, FIFO within
+    a priority, so the model the running node needs overtakes speculative
+    prefetches as soon as a slot frees up. Received bytes are charged against
+    a token bucket that caps aggregate throughput.
+    '''
+
+    def __init__(self, max_connections=16, max_bytes_per_second=0):
+        self.max_connections = max(1, int(max_connections))
+        self.rate = max(0, int(max_bytes_per_second))
+        self.burst = max(self.rate // 4, 1024 * 1024)
+        self.active = 0
+        self.waiters = {}
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.bucket_lock = threading.Lock()
+
+    # CONNECTION SLOTS
+
+    @contextlib.contextmanager
+    def connection(self, priority=PRIORITY_FOREGROUND):
+        '''
+        Hold one connection slot. `priority` may be a callable so that a
+        prefetch promoted while it waits is re-ranked.
+        '''
+        get_priority = priority if callable(priority) else (lambda: priority)
+        ticket = next(self.sequence)
+        with self.condition:
+            self.waiters[ticket] = get_priority
+            try:
+                while self.active >= self.max_connections or self.next_ticket() != ticket:
+                    self.condition.wait(1.0)
+            finally:
+                del self.waiters[ticket]
+            self.active += 1
+            self.condition.notify_all()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active -= 1
+                self.condition.notify_all()
+
+    def next_ticket(self):
+        return min(self.waiters, key=lambda ticket: (self.waiters[ticket](), ticket))
+
+    # BANDWIDTH
+
+    def consume(self, size):
+        '''Block until `size` bytes fit in the aggregate bandwidth budget.'''
+        if not self.rate or size <= 0:
+            return
+        while True:
+            with self.bucket_lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+                self.refilled_at = now
+                if self.tokens > 0:
+                    # Allow a short debt so reads larger than the burst still make progress
+                    self.tokens -= size
+                    return
+                delay = -self.tokens / self.rate
+            time.sleep(min(delay, 1.0))
+
+    def configure(self, max_connections=None, max_bytes_per_second=None):
+        with self.condition:
+            if max_connections is not None:
+                self.max_connections = max(1, int(max_connections))
+            self.condition.notify_all()
+        with self.bucket_lock:
+            if max_bytes_per_second is not None:
+                self.rate = max(0, int(max_bytes_per_second))
+                self.burst = max(self.rate // 4, 1024 * 1024)
+                self.tokens = min(self.tokens, self.burst)
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def get_download_budget():
+    global _budget
+    if _budget is None:
+        with _budget_lock:
+            if _budget is None:
+                _budget = DownloadBudget(
+                    max_connections=os.environ.get('CIVITAI_MAX_CONNECTIONS', 16),
+                    max_bytes_per_second=os.environ.get('CIVITAI_MAX_BYTES_PER_SECOND', 0),
+                )
+    return _budget
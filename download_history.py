@@ -0,0 +1,280 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+HISTORY_JSON_PATH = os.path.join(ROOT_PATH, 'download_history.json')
+HISTORY_DB_PATH = os.path.join(ROOT_PATH, 'download_history.db')
+
+MSG_PREFIX = '\33[1m\33[34m[CivitAI] \33[0m'
+
+
+class DownloadHistory:
+    '''
+    SQLite backed model metadata store
+
+    Replaces `download_history.json`. Each row is one file entry of a model
+    version, indexed by model id, version id, file id, SHA256 and filename.
+    An existing JSON history is imported once on first use.
+    '''
+
+    def __init__(self, db_path=HISTORY_DB_PATH, json_path=HISTORY_JSON_PATH):
+        self.db_path = db_path
+        self.json_path = json_path
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.initialized = False
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        if not self.initialized:
+            with self.lock:
+                if not self.initialized:
+                    self.create_schema(conn)
+                    self.migrate_json(conn)
+                    self.initialized = True
+        return conn
+
+    # SCHEMA
+
+    @staticmethod
+    def create_schema(conn):
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS files (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    model_id TEXT NOT NULL,
+                    version_id INTEGER,
+                    file_id INTEGER,
+                    name TEXT,
+                    sha256 TEXT,
+                    download_url TEXT,
+                    details TEXT NOT NULL,
+                    UNIQUE (model_id, version_id, download_url)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_files_model_id ON files (model_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_files_version_id ON files (version_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_files_file_id ON files (file_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files (sha256)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_files_name ON files (name COLLATE NOCASE)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute('CREATE TABLE IF NOT EXISTS unknown_hashes (sha256 TEXT PRIMARY KEY, checked_at REAL NOT NULL)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS model_usage (
+                    path TEXT PRIMARY KEY,
+                    folder TEXT,
+                    model_id TEXT,
+                    version_id INTEGER,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    downloaded INTEGER NOT NULL DEFAULT 0,
+                    last_used REAL NOT NULL,
+                    use_count INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_model_usage_folder ON model_usage (folder, downloaded)')
+            conn.execute('CREATE TABLE IF NOT EXISTS pinned_airs (air TEXT PRIMARY KEY, pinned_at REAL NOT NULL)')
+
+    # ONE-TIME JSON MIGRATION
+
+    def migrate_json(self, conn):
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return
+
+        migrated = 0
+        if self.json_path and os.path.exists(self.json_path):
+            try:
+                with open(self.json_path, 'r', encoding='utf-8') as history_file:
+                    download_history = json.load(history_file)
+            except (OSError, ValueError):
+                download_history = {}
+
+            with conn:
+                for model_id, model_versions in download_history.items():
+                    for version_details in model_versions or []:
+                        for file_details in version_details.get('files') or []:
+                            if file_details:
+                                self.insert(conn, model_id, version_details.get('id'), file_details)
+                                migrated += 1
+
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)", (str(migrated),))
+
+        if migrated:
+            print(f"{MSG_PREFIX}Migrated {migrated} entries from `download_history.json` to `download_history.db`")
+
+    # ROW HELPERS
+
+    @staticmethod
+    def insert(conn, model_id, version_id, file_details):
+        hashes = file_details.get('hashes') or {}
+        sha256 = hashes.get('SHA256')
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO files (model_id, version_id, file_id, name, sha256, download_url, details) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (
+                str(model_id),
+                version_id,
+                file_details.get('id'),
+                file_details.get('name'),
+                sha256.upper() if sha256 else None,
+                file_details.get('downloadUrl'),
+                json.dumps(file_details, ensure_ascii=False),
+            )
+        )
+        return cursor.rowcount > 0
+
+    # Rows are returned grouped by version in the order versions were first
+    # recorded, which matches iteration order of the old JSON layout.
+    ORDER = '''
+        ORDER BY (SELECT MIN(v.seq) FROM files v WHERE v.model_id = files.model_id AND v.version_id IS files.version_id), seq
+    '''
+
+    # LOOKUPS
+
+    def model_files(self, model_id):
+        rows = self.connection().execute(
+            'SELECT version_id, details FROM files WHERE model_id = ? ' + self.ORDER, (str(model_id),)
+        ).fetchall()
+        return [(version_id, json.loads(details)) for version_id, details in rows]
+
+    def find_by_sha256(self, sha256):
+        if not sha256:
+            return None
+        row = self.connection().execute(
+            'SELECT model_id, version_id, details FROM files WHERE sha256 = ? AND version_id IS NOT NULL AND version_id != 0 ORDER BY seq LIMIT 1',
+            (str(sha256).upper(),)
+        ).fetchone()
+        if row:
+            return row[0], row[1], json.loads(row[2])
+        return None
+
+    def find_by_name(self, name):
+        if not name:
+            return None
+        row = self.connection().execute(
+            'SELECT model_id, version_id, details FROM files WHERE name = ? COLLATE NOCASE ORDER BY seq LIMIT 1', (name,)
+        ).fetchone()
+        if row:
+            return row[0], row[1], json.loads(row[2])
+        return None
+
+    def find_by_file_id(self, file_id):
+        if not file_id:
+            return None
+        row = self.connection().execute(
+            'SELECT model_id, version_id, details FROM files WHERE file_id = ? ORDER BY seq LIMIT 1', (int(file_id),)
+        ).fetchone()
+        if row:
+            return row[0], row[1], json.loads(row[2])
+        return None
+
+    # WRITES
+
+    def add(self, model_id, version_id, file_details):
+        if not file_details:
+            return False
+        conn = self.connection()
+        with conn:
+            sha256 = (file_details.get('hashes') or {}).get('SHA256')
+            if sha256:
+                conn.execute('DELETE FROM unknown_hashes WHERE sha256 = ?', (sha256.upper(),))
+            return self.insert(conn, model_id, version_id, file_details)
+
+    # NEGATIVE CACHE | HASHES CIVITAI DOES NOT KNOW ABOUT
+
+    def is_unknown_hash(self, sha256, ttl):
+        if not sha256:
+            return False
+        row = self.connection().execute(
+            'SELECT checked_at FROM unknown_hashes WHERE sha256 = ?', (str(sha256).upper(),)
+        ).fetchone()
+        return bool(row) and time.time() - row[0] < ttl
+
+    def mark_unknown_hash(self, sha256):
+        if not sha256:
+            return
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO unknown_hashes (sha256, checked_at) VALUES (?, ?)', (str(sha256).upper(), time.time())
+            )
+
+    def clear_unknown_hashes(self, sha256=None):
+        conn = self.connection()
+        with conn:
+            if sha256:
+                conn.execute('DELETE FROM unknown_hashes WHERE sha256 = ?', (str(sha256).upper(),))
+            else:
+                conn.execute('DELETE FROM unknown_hashes')
+
+    # MODEL USAGE | LAST LOAD TIME AND LOAD COUNT PER FILE
+
+    def record_use(self, path, folder=None, model_id=None, version_id=None, size=0, downloaded=False, used=True):
+        now = time.time()
+        conn = self.connection()
+        with conn:
+            conn.execute('''
+                INSERT INTO model_usage (path, folder, model_id, version_id, size, downloaded, last_used, use_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    folder = COALESCE(excluded.folder, folder),
+                    model_id = COALESCE(excluded.model_id, model_id),
+                    version_id = COALESCE(excluded.version_id, version_id),
+                    size = CASE WHEN excluded.size > 0 THEN excluded.size ELSE size END,
+                    downloaded = MAX(downloaded, excluded.downloaded),
+                    last_used = excluded.last_used,
+                    use_count = use_count + excluded.use_count
+            ''', (path, folder, str(model_id) if model_id else None, version_id, size, int(bool(downloaded)), now, int(bool(used))))
+
+    def downloaded_files(self, folder=None):
+        '''Rows for files this package downloaded: (path, folder, model_id, version_id, size, last_used, use_count).'''
+        query = 'SELECT path, folder, model_id, version_id, size, last_used, use_count FROM model_usage WHERE downloaded = 1'
+        params = ()
+        if folder:
+            query += ' AND folder = ?'
+            params = (folder,)
+        return self.connection().execute(query, params).fetchall()
+
+    def used_files(self, model_id):
+        '''(path, version_id) of every file of the model that was loaded or downloaded, under whatever name it has.'''
+        return self.connection().execute(
+            'SELECT path, version_id FROM model_usage WHERE model_id = ?', (str(model_id),)
+        ).fetchall()
+
+    def forget_use(self, path):
+        conn = self.connection()
+        with conn:
+            conn.execute('DELETE FROM model_usage WHERE path = ?', (path,))
+
+    # PINNED AIRS | NEVER EVICTED
+
+    def pin(self, air):
+        conn = self.connection()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO pinned_airs (air, pinned_at) VALUES (?, ?)', (str(air), time.time()))
+
+    def unpin(self, air):
+        conn = self.connection()
+        with conn:
+            conn.execute('DELETE FROM pinned_airs WHERE air = ?', (str(air),))
+
+    def pinned_airs(self):
+        return {row[0] for row in self.connection().execute('SELECT air FROM pinned_airs').fetchall()}
+
+
+_download_history = None
+
+
+def get_download_history():
+    global _download_history
+    if _download_history is None:
+        _download_history = DownloadHistory()
+    return _download_history
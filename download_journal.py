@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+
+from .part_file import preallocate
+
+
+PART_SUFFIX = '.part'
+JOURNAL_SUFFIX = '.part.journal'
+
+
+class DownloadJournal:
+    '''
+    Sidecar journal for a resumable download
+
+    Bytes are written to `<save_path>.part` and every completed byte range is
+    recorded in `<save_path>.part.journal` together with the expected SHA256,
+    size, source URL and ETag. A later download of the same file only fetches
+    the missing ranges; the `.part` file is renamed into place once verified.
+    '''
+    flush_interval = 2.0
+
+    def __init__(self, save_path, total_size, sha256=None, url=None, etag=None):
+        self.save_path = save_path
+        self.part_path = save_path + PART_SUFFIX
+        self.journal_path = save_path + JOURNAL_SUFFIX
+        self.total_size = total_size
+        self.sha256 = sha256.upper() if sha256 else None
+        self.url = url.split('?')[0] if url else None
+        self.etag = etag
+        self.completed = []
+        self.lock = threading.Lock()
+        self.last_flush = 0
+
+    # LOAD / MATCH EXISTING JOURNAL
+
+    def resume(self):
+        '''
+        Load the completed ranges of a previous attempt if the journal and its
+        `.part` file describe the same file. Otherwise start from scratch.
+        Returns the number of bytes already on disk.
+        '''
+        self.completed = []
+        if not os.path.exists(self.journal_path) or not os.path.exists(self.part_path):
+            return 0
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as journal_file:
+                journal = json.load(journal_file)
+        except (OSError, ValueError):
+            return 0
+
+        if journal.get('total_size') != self.total_size:
+            return 0
+        if self.sha256 and journal.get('sha256') and journal.get('sha256') != self.sha256:
+            return 0
+        if self.url and journal.get('url') and journal.get('url') != self.url:
+            return 0
+        if self.etag and journal.get('etag') and journal.get('etag') != self.etag:
+            return 0
+        if os.path.getsize(self.part_path) != self.total_size:
+            return 0
+
+        self.completed = self.merge([tuple(r) for r in journal.get('ranges', []) if len(r) == 2])
+        return sum(end - start for start, end in self.completed)
+
+    # RANGE BOOKKEEPING
+
+    @staticmethod
+    def merge(ranges):
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def mark(self, start, length):
+        if length <= 0:
+            return
+        with self.lock:
+            self.completed = self.merge(self.completed + [(start, start + length)])
+            if time.monotonic() - self.last_flush < self.flush_interval:
+                return
+        self.flush()
+
+    def missing(self):
+        '''Inclusive (start, end) spans that still need to be downloaded.'''
+        with self.lock:
+            spans = []
+            position = 0
+            for start, end in self.completed:
+                if start > position:
+                    spans.append((position, start - 1))
+                position = max(position, end)
+            if position < self.total_size:
+                spans.append((position, self.total_size - 1))
+            return spans
+
+    # PERSISTENCE
+
+    def flush(self):
+        with self.lock:
+            journal = {
+                'url': self.url,
+                'etag': self.etag,
+                'sha256': self.sha256,
+                'total_size': self.total_size,
+                'ranges': [list(r) for r in self.completed],
+            }
+            self.last_flush = time.monotonic()
+            temp_path = self.journal_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as journal_file:
+                json.dump(journal, journal_file)
+            os.replace(temp_path, self.journal_path)
+
+    def prepare(self):
+        '''Create (or keep, when resuming) the preallocated `.part` file.'''
+        if self.completed and os.path.exists(self.part_path):
+            return
+        preallocate(self.part_path, self.total_size)
+        self.flush()
+
+    def finalize(self):
+        '''Atomically move the verified `.part` file to its real name.'''
+        os.replace(self.part_path, self.save_path)
+        self.discard_journal()
+
+    def discard(self):
+        for path in (self.part_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def discard_journal(self):
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
@@ -0,0 +1,120 @@
+import concurrent.futures
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+LOCK_SUFFIX = '.lock'
+
+MSG_PREFIX = '\33[1m\33[34m[CivitAI] \33[0m'
+
+
+class ModelFileLock:
+    '''
+    Advisory cross-process lock for one model file
+
+    Held while a model is verified or downloaded so that two ComfyUI processes
+    sharing a model directory never write the same file at once. The lock file
+    `.<name>.lock` sits next to the model and is left in place afterwards.
+    Loads take the lock shared, so eviction can tell a file is in use.
+    '''
+    poll_interval = 0.5
+
+    def __init__(self, save_path, shared=False):
+        directory, name = os.path.split(save_path)
+        self.name = name
+        self.lock_path = os.path.join(directory, f'.{name}{LOCK_SUFFIX}')
+        self.shared = shared
+        self.file = None
+
+    def try_lock(self):
+        try:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def acquire_nowait(self):
+        self.file = open(self.lock_path, 'a+b')
+        if self.try_lock():
+            return True
+        self.file.close()
+        self.file = None
+        return False
+
+    def acquire(self, timeout=None):
+        self.file = open(self.lock_path, 'a+b')
+        if self.try_lock():
+            return True
+        print(f"{MSG_PREFIX}`{self.name}` is being downloaded by another process, waiting for it to finish...")
+        started = time.monotonic()
+        while not self.try_lock():
+            if timeout is not None and time.monotonic() - started > timeout:
+                self.file.close()
+                self.file = None
+                return False
+            time.sleep(self.poll_interval)
+        return True
+
+    def release(self):
+        if not self.file:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# SINGLE-FLIGHT | ONE DOWNLOAD PER FILE PER PROCESS
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def single_flight(key, fn):
+    '''
+    Run `fn` once for concurrent callers with the same key; everyone else waits
+    for and shares its result (or exception).
+    '''
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = concurrent.futures.Future()
+            _inflight[key] = future
+
+    if not owner:
+        return future.result()
+
+    try:
+        result = fn()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+
+from tqdm import tqdm
+
+import comfy.utils
+
+from .metrics import clear_gauge, inc, observe, set_gauge
+
+
+MSG_PREFIX = '\33[1m\33[34m[CivitAI] \33[0m'
+
+
+class DownloadProgress:
+    '''
+    Aggregated progress reporting for one download
+
+    Chunk workers only add to a counter of their own, which needs no lock. A
+    single ticker thread sums the counters at a fixed rate
+    (`CIVITAI_PROGRESS_INTERVAL` seconds) and publishes the total to tqdm and
+    the ComfyUI progress bar, so neither sees more than a few updates a second
+    however many workers are running. The ticker also keeps a smoothed
+    throughput and ETA for the download.
+    '''
+    interval = float(os.environ.get('CIVITAI_PROGRESS_INTERVAL', 0.25))
+    smoothing = 0.3
+
+    def __init__(self, name, total, initial=0):
+        self.name = name
+        self.total = total
+        self.initial = initial
+        self.counters = []
+        self.counters_lock = threading.Lock()
+        self.local = threading.local()
+        self.published = initial
+        self.rate = 0.0
+        self.started = None
+        self.sampled_at = None
+        self.closed = threading.Event()
+        self.thread = None
+        self.total_pbar = None
+        self.comfy_pbar = None
+
+    # WORKER SIDE
+
+    def update(self, size):
+        counter = getattr(self.local, 'counter', None)
+        if counter is None:
+            counter = self.local.counter = [0]
+            with self.counters_lock:
+                self.counters.append(counter)
+        counter[0] += size
+
+    @property
+    def completed(self):
+        with self.counters_lock:
+            counters = list(self.counters)
+        return self.initial + sum(counter[0] for counter in counters)
+
+    # TICKER
+
+    def start(self):
+        self.total_pbar = tqdm(total=self.total, initial=self.initial, unit='B', unit_scale=True, unit_divisor=1024, leave=True)
+        self.comfy_pbar = comfy.utils.ProgressBar(self.total)
+        self.comfy_pbar.update_absolute(self.initial, self.total)
+        self.started = self.sampled_at = time.monotonic()
+        self.thread = threading.Thread(target=self.run, name='civitai-progress', daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.closed.wait(self.interval):
+            self.tick()
+
+    def tick(self):
+        completed = min(self.completed, self.total)
+        now = time.monotonic()
+        delta = completed - self.published
+        elapsed = now - self.sampled_at
+        if elapsed > 0:
+            sample = delta / elapsed
+            self.rate = sample if not self.rate else self.rate + self.smoothing * (sample - self.rate)
+        self.sampled_at = now
+        if delta:
+            self.published = completed
+            self.total_pbar.update(delta)
+            self.comfy_pbar.update_absolute(completed, self.total)
+        self.publish_rate()
+
+    def publish_rate(self):
+        '''Show the smoothed throughput and ETA on the tqdm bar and as `/civitai/metrics` gauges.'''
+        eta = self.eta
+        self.total_pbar.set_postfix_str(f"{self.rate / 1024 ** 2:.1f} MiB/s, ETA {f'{eta:.0f}s' if eta is not None else '?'}", refresh=False)
+        set_gauge('download_rate_bytes_per_second', self.rate, download=self.name)
+        if eta is None:
+            clear_gauge('download_eta_seconds', download=self.name)
+        else:
+            set_gauge('download_eta_seconds', eta, download=self.name)
+
+    @property
+    def eta(self):
+        '''Seconds left at the current smoothed throughput, or None while stalled.'''
+        if not self.rate:
+            return None
+        return (self.total - self.published) / self.rate
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        if self.thread:
+            self.thread.join()
+            self.tick()
+            self.total_pbar.close()
+            clear_gauge('download_rate_bytes_per_second', download=self.name)
+            clear_gauge('download_eta_seconds', download=self.name)
+            elapsed = time.monotonic() - self.started
+            downloaded = self.published - self.initial
+            inc('downloaded_bytes', downloaded)
+            observe('download_transfer', elapsed)
+            if elapsed > 0 and downloaded:
+                print(f"{MSG_PREFIX}Downloaded {downloaded / 1024 ** 2:.1f} MiB of `{self.name}` in {elapsed:.1f}s ({downloaded / 1024 ** 2 / elapsed:.1f} MiB/s)")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
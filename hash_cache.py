@@ -0,0 +1,155 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from .metrics import inc, timer
+
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+HASH_CACHE_PATH = os.path.join(ROOT_PATH, 'hash_cache.db')
+
+
+class HashCache:
+    '''
+    Persistent SHA256 cache for local model files
+
+    Digests are keyed by (realpath, size, mtime_ns, inode) so a file is only
+    rehashed when it is new or has been modified since it was last hashed.
+    '''
+    block_size = 1024 * 1024
+
+    def __init__(self, db_path=HASH_CACHE_PATH):
+        self.db_path = db_path
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.initialized = False
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            self.local.conn = conn
+        if not self.initialized:
+            with self.lock:
+                if not self.initialized:
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS file_hashes (
+                            path TEXT PRIMARY KEY,
+                            size INTEGER NOT NULL,
+                            mtime_ns INTEGER NOT NULL,
+                            inode INTEGER NOT NULL,
+                            sha256 TEXT NOT NULL,
+                            hashed_at REAL NOT NULL
+                        )
+                    ''')
+                    conn.commit()
+                    self.initialized = True
+        return conn
+
+    # FILE IDENTITY
+
+    @staticmethod
+    def file_key(file_path):
+        real_path = os.path.realpath(file_path)
+        stat = os.stat(real_path)
+        return (real_path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    # CACHE ACCESS
+
+    def get(self, file_path):
+        try:
+            key = self.file_key(file_path)
+        except OSError:
+            return None
+        row = self.connection().execute(
+            'SELECT size, mtime_ns, inode, sha256 FROM file_hashes WHERE path = ?', (key[0],)
+        ).fetchone()
+        if row and tuple(row[:3]) == key[1:]:
+            return row[3]
+        return None
+
+    def modified(self, file_path):
+        '''True if a digest was recorded for this path but the file has changed since it was hashed.'''
+        try:
+            key = self.file_key(file_path)
+        except OSError:
+            return False
+        row = self.connection().execute(
+            'SELECT size, mtime_ns, inode FROM file_hashes WHERE path = ?', (key[0],)
+        ).fetchone()
+        return bool(row) and tuple(row) != key[1:]
+
+    def put(self, file_path, sha256, key=None):
+        if not sha256:
+            return
+        try:
+            key = key or self.file_key(file_path)
+        except OSError:
+            return
+        conn = self.connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, inode, sha256, hashed_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (*key, sha256.upper(), time.time())
+        )
+        conn.commit()
+
+    def invalidate(self, file_path):
+        conn = self.connection()
+        conn.execute('DELETE FROM file_hashes WHERE path = ?', (os.path.realpath(file_path),))
+        conn.commit()
+
+    # HASH WITH CACHE
+
+    def sha256(self, file_path):
+        cached = self.get(file_path)
+        if cached:
+            inc('hash_cache', result='hit')
+            return cached
+
+        inc('hash_cache', result='miss')
+        with timer('phase', phase='hash'):
+            digest, key = hash_file(file_path, self.block_size)
+        inc('hashed_bytes', os.path.getsize(file_path))
+        if key:
+            self.put(file_path, digest, key)
+        return digest
+
+
+# HASH A FILE | SAFE TO RUN IN A WORKER PROCESS
+
+def hash_file(file_path, block_size=HashCache.block_size):
+    '''
+    Returns (SHA256, file key). The key is None if the file changed while it
+    was being read, in which case the digest must not be cached.
+    '''
+    key = HashCache.file_key(file_path)
+    sha256_hash = hashlib.sha256()
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    with open(key[0], 'rb', buffering=0) as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            sha256_hash.update(view[:read])
+    digest = sha256_hash.hexdigest().upper()
+
+    try:
+        if HashCache.file_key(file_path) != key:
+            key = None
+    except OSError:
+        key = None
+
+    return digest, key
+
+
+_hash_cache = None
+
+
+def get_hash_cache():
+    global _hash_cache
+    if _hash_cache is None:
+        _hash_cache = HashCache()
+    return _hash_cache
@@ -0,0 +1,319 @@
+import email.utils
+import os
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import inc, observe
+
+
+POOL_CONNECTIONS = 8
+POOL_MAXSIZE = 32
+
+# Worth retrying; the origin may answer next time
+RETRY_STATUS = (408, 429, 500, 502, 503, 504)
+# The origin itself is unhealthy; these count against its circuit breaker
+FAULT_STATUS = (500, 502, 503, 504)
+
+ERR_PREFIX = '\33[1m\33[31m[CivitAI]\33[0m\33[1m Error: \33[0m'
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    '''
+    Shared keep-alive session used for all CivitAI API calls and chunk workers,
+    so connections (and their TLS handshakes) are reused across requests.
+    '''
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+# RETRIES | BACKOFF WITH JITTER AND CIRCUIT BREAKING
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    '''
+    Fails requests to a host fast while it is down
+
+    After `failure_threshold` consecutive faults (connection errors, timeouts
+    or 5xx responses) the circuit opens and every request to the host fails
+    immediately for `reset_timeout` seconds. The next request is then let
+    through as a trial: an answer closes the circuit, a fault opens it again.
+    '''
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            if self.clock() - self.opened_at < self.reset_timeout:
+                return 'open'
+            return 'half-open'
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.clock() - self.opened_at < self.reset_timeout or self.trial:
+                return False
+            self.trial = True
+            return True
+
+    def retry_in(self):
+        '''Seconds until the next trial request may go through; 0 once it may go now.'''
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.trial = False
+
+
+class RetryPolicy:
+    '''
+    Retry timing and circuit breaking shared by every CivitAI HTTP call
+
+    Failed attempts back off exponentially with full jitter, up to `max_delay`.
+    A `Retry-After` header on 429/503 takes precedence, capped at
+    `max_retry_after`. Each host has its own circuit breaker, shared by all
+    callers in the process, so a dead API or CDN is not hammered by every
+    chunk retrying on its own; download workers wait for the breaker's trial
+    request instead of failing. `sleep`, `clock` and `random`
+    can be swapped out to drive the policy against a fault-injecting server.
+    '''
+
+    def __init__(self, max_retries=4, base_delay=0.5, max_delay=30.0, max_retry_after=300.0,
+                 failure_threshold=5, reset_timeout=30.0, sleep=time.sleep, clock=time.monotonic, random=random.random):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.sleep = sleep
+        self.clock = clock
+        self.random = random
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    # CIRCUIT BREAKERS
+
+    def breaker(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout, self.clock)
+            return breaker
+
+    def check(self, url, timeout=None):
+        '''
+        Raise `CircuitOpenError` if requests to this host should fail fast. With
+        a `timeout`, first wait up to that many seconds for the circuit to let
+        this request through, as the half-open trial or after another caller's
+        trial has closed it again.
+        '''
+        breaker = self.breaker(url)
+        deadline = self.clock() + timeout if timeout else None
+        while not breaker.allow():
+            remaining = deadline - self.clock() if deadline is not None else 0
+            if remaining <= 0:
+                inc('circuit_rejections', host=urlsplit(url).netloc)
+                raise CircuitOpenError(f"{ERR_PREFIX}`{urlsplit(url).netloc}` is not responding; giving up until it recovers.")
+            # Sleep until the trial is due, or poll while another caller's trial is in flight
+            self.sleep(min(remaining, breaker.retry_in() or self.base_delay))
+
+    def record(self, url, response=None, error=None):
+        inc('http_requests', host=urlsplit(url).netloc, status=response.status_code if response is not None else 'error')
+        if error is not None or (response is not None and response.status_code in FAULT_STATUS):
+            self.breaker(url).record_failure()
+        else:
+            self.breaker(url).record_success()
+
+    # BACKOFF
+
+    @staticmethod
+    def retry_after(response):
+        '''Seconds requested by a `Retry-After` header on 429/503, or None.'''
+        if response is None or response.status_code not in (429, 503):
+            return None
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        if value.strip().isdigit():
+            return float(value)
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, retry_at.timestamp() - time.time())
+
+    def delay(self, attempt, response=None):
+        '''Seconds to wait before retry number `attempt` (1-based).'''
+        retry_after = self.retry_after(response)
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return self.random() * min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+
+    def wait(self, attempt, response=None):
+        delay = self.delay(attempt, response)
+        inc('http_retries')
+        observe('retry_wait', delay)
+        self.sleep(delay)
+
+    # ONE-SHOT REQUESTS
+
+    def request(self, method, url, max_retries=None, session=None, **kwargs):
+        '''
+        `session.request` with retries. The last response is returned even if
+        it is an error status; the last exception is raised once retries run out.
+        '''
+        max_retries = self.max_retries if max_retries is None else max_retries
+        session = session or get_session()
+        attempt = 0
+        while True:
+            self.check(url)
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.record(url, error=e)
+                if attempt >= max_retries:
+                    raise
+                attempt += 1
+                self.wait(attempt)
+                continue
+
+            self.record(url, response)
+            if response.status_code not in RETRY_STATUS or attempt >= max_retries:
+                return response
+            response.close()
+            attempt += 1
+            self.wait(attempt, response)
+
+
+_retry_policy = None
+
+
+def get_retry_policy():
+    '''
+    Process-wide policy. `CIVITAI_HTTP_RETRIES`, `CIVITAI_RETRY_BASE_DELAY`,
+    `CIVITAI_RETRY_MAX_DELAY`, `CIVITAI_CIRCUIT_THRESHOLD` and
+    `CIVITAI_CIRCUIT_RESET` override the defaults.
+    '''
+    global _retry_policy
+    if _retry_policy is None:
+        with _session_lock:
+            if _retry_policy is None:
+                _retry_policy = RetryPolicy(
+                    max_retries=int(os.environ.get('CIVITAI_HTTP_RETRIES', 4)),
+                    base_delay=float(os.environ.get('CIVITAI_RETRY_BASE_DELAY', 0.5)),
+                    max_delay=float(os.environ.get('CIVITAI_RETRY_MAX_DELAY', 30)),
+                    failure_threshold=int(os.environ.get('CIVITAI_CIRCUIT_THRESHOLD', 5)),
+                    reset_timeout=float(os.environ.get('CIVITAI_CIRCUIT_RESET', 30)),
+                )
+    return _retry_policy
+
+
+def request(method, url, **kwargs):
+    return get_retry_policy().request(method, url, **kwargs)
+
+
+class ProbeResult:
+    '''
+    What a single ranged request tells us about a download: the final URL after
+    redirects, the total size, the server's filename and whether it honors ranges.
+    '''
+
+    def __init__(self, url, status_code, total_size=None, filename=None, accept_ranges=False, etag=None, last_modified=None):
+        self.url = url
+        self.status_code = status_code
+        self.total_size = total_size
+        self.filename = filename
+        self.accept_ranges = accept_ranges
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def ok(self):
+        return self.status_code in (200, 206)
+
+
+def probe(url, timeout=30):
+    '''
+    Discover size, filename and range support for `url` with one `bytes=0-0` request.
+    Only the headers are used; the body is never read, so a transfer dropped
+    after the headers can't fail the probe.
+    '''
+    response = request('GET', url, headers={'Range': 'bytes=0-0'}, stream=True, allow_redirects=True, timeout=timeout)
+    try:
+        headers = response.headers
+        total_size = None
+        accept_ranges = False
+
+        content_range = headers.get('Content-Range')
+        if response.status_code == 206 and content_range:
+            match = re.search(r'/(\d+)', content_range)
+            if match:
+                total_size = int(match.group(1))
+                accept_ranges = True
+        if total_size is None:
+            content_length = headers.get('Content-Length')
+            if response.status_code == 200 and content_length and content_length.isdigit():
+                total_size = int(content_length)
+
+        filename = None
+        content_disposition = headers.get('Content-Disposition')
+        if content_disposition:
+            found = re.findall("filename=(.+)", content_disposition)
+            if found:
+                filename = found[0].split(';')[0].strip('"')
+
+        return ProbeResult(
+            url=response.url,
+            status_code=response.status_code,
+            total_size=total_size,
+            filename=filename,
+            accept_ranges=accept_ranges,
+            etag=headers.get('ETag'),
+            last_modified=headers.get('Last-Modified'),
+        )
+    finally:
+        response.close()
@@ -0,0 +1,188 @@
+import concurrent.futures
+import multiprocessing
+import os
+import time
+
+import requests
+
+import folder_paths
+
+from .CivitAI_Model import CivitAI_Model, MSG_PREFIX, WARN_PREFIX
+from .api_cache import get_api_cache
+from .download_history import get_download_history
+from .hash_cache import get_hash_cache, hash_file
+from .http_client import CircuitOpenError, request
+
+
+DEFAULT_FOLDERS = ('checkpoints', 'loras')
+
+
+# COLLECT MODEL FILES
+
+def library_files(folders=DEFAULT_FOLDERS):
+    files = []
+    seen = set()
+    for folder in folders:
+        for name in folder_paths.get_filename_list(folder):
+            full_path = folder_paths.get_full_path(folder, name)
+            if full_path and full_path not in seen:
+                seen.add(full_path)
+                files.append(full_path)
+    return files
+
+
+# HASH IN PARALLEL
+
+def hash_executor(workers, processes=False):
+    # Forked workers avoid re-importing ComfyUI, but forking is only safe from a single-threaded
+    # process like the CLI, not ComfyUI's server; hashlib releases the GIL, so threads still scale
+    if processes and 'fork' in multiprocessing.get_all_start_methods():
+        return concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+    return concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+
+def hash_library(files, workers=None, processes=False):
+    '''
+    Returns {file_path: SHA256}, hashing only files the hash cache has not seen
+    in their current state.
+    '''
+    hash_cache = get_hash_cache()
+    hashes = {}
+    pending = []
+    for file_path in files:
+        cached = hash_cache.get(file_path)
+        if cached:
+            hashes[file_path] = cached
+        else:
+            pending.append(file_path)
+
+    if pending:
+        workers = workers or min(len(pending), os.cpu_count() or 4)
+        with hash_executor(workers, processes) as executor:
+            futures = {executor.submit(hash_file, file_path): file_path for file_path in pending}
+            for future in concurrent.futures.as_completed(futures):
+                file_path = futures[future]
+                try:
+                    digest, key = future.result()
+                except OSError as e:
+                    print(f"{WARN_PREFIX}Unable to hash `{file_path}`: {e}")
+                    continue
+                if key:
+                    hash_cache.put(file_path, digest, key)
+                hashes[file_path] = digest
+
+    return hashes
+
+
+# RESOLVE HASHES AGAINST CIVITAI
+
+def lookup_batch(hash_values, api=None):
+    '''
+    Resolve a batch of hashes with one `POST /model-versions/by-hash` request.
+    Returns {SHA256: (model_id, version_id, file_details)} for the hashes that
+    were found, or None if the batch endpoint is unavailable.
+    '''
+    api = api or CivitAI_Model.api
+    response = request('POST', f"{api}/model-versions/by-hash", json=list(hash_values), timeout=60)
+    if response.status_code != 200:
+        return None
+
+    wanted = set(hash_values)
+    found = {}
+    for model_details in response.json() or []:
+        model_id = model_details.get('modelId')
+        version_id = model_details.get('id')
+        model_info = model_details.get('model') or {}
+        model_type = model_info.get('type', 'Model')
+        trained_words = model_details.get('trainedWords', [])
+        for file_details in model_details.get('files', []):
+            sha256 = ((file_details.get('hashes') or {}).get('SHA256') or '').upper()
+            if sha256 in wanted and sha256 not in found:
+                file_details.update({"model_type": model_type, "trained_words": trained_words})
+                found[sha256] = (model_id, version_id, file_details)
+    return found
+
+
+def lookup_single(hash_value, api=None):
+    api = api or CivitAI_Model.api
+    response = get_api_cache().get(f"{api}/model-versions/by-hash/{hash_value}")
+    if response.status_code != 200:
+        return response.status_code, None
+    model_details = response.json() or {}
+    model_info = model_details.get('model') or {}
+    for file_details in model_details.get('files', []):
+        if ((file_details.get('hashes') or {}).get('SHA256') or '').upper() == hash_value:
+            file_details.update({"model_type": model_info.get('type', 'Model'), "trained_words": model_details.get('trainedWords', [])})
+            return 200, (model_details.get('modelId'), model_details.get('id'), file_details)
+    return 200, None
+
+
+# INDEX ENTRY POINT
+
+def index_library(folders=DEFAULT_FOLDERS, workers=None, processes=False, batch_size=100, api=None, refresh=False):
+    '''
+    Hash every model in the given `folder_paths` folders and record what CivitAI
+    knows about them in the download history, so loads on this machine never
+    pay for hashing or lookups. `api` may point at a local stand-in for the
+    CivitAI API. Files are hashed on threads; `processes=True` forks worker
+    processes instead and is meant for the CLI only. Returns a summary dict.
+    '''
+    started = time.monotonic()
+    history = get_download_history()
+
+    files = library_files(folders)
+    print(f"{MSG_PREFIX}Indexing {len(files)} model files from {', '.join(folders)}")
+    hashes = hash_library(files, workers=workers, processes=processes)
+    hashed_at = time.monotonic()
+
+    unresolved = []
+    known = 0
+    for hash_value in sorted(set(hashes.values())):
+        if history.find_by_sha256(hash_value):
+            known += 1
+        elif refresh or not history.is_unknown_hash(hash_value, CivitAI_Model.unknown_hash_ttl):
+            unresolved.append(hash_value)
+
+    identified = 0
+    unknown = 0
+    failed = 0
+    for i in range(0, len(unresolved), batch_size):
+        batch = unresolved[i:i + batch_size]
+        try:
+            found = lookup_batch(batch, api=api)
+            if found is None:
+                found = {}
+                for hash_value in batch:
+                    status_code, result = lookup_single(hash_value, api=api)
+                    if result:
+                        found[hash_value] = result
+                    elif status_code not in (200, 404):
+                        found[hash_value] = None  # transient failure, don't remember as unknown
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            # Leave this batch for the next run rather than abort the whole index
+            print(f"{WARN_PREFIX}Unable to look up {len(batch)} hashes on CivitAI: {e}")
+            failed += len(batch)
+            continue
+
+        for hash_value in batch:
+            result = found.get(hash_value)
+            if result:
+                model_id, version_id, file_details = result
+                history.add(model_id, version_id, file_details)
+                identified += 1
+            elif hash_value not in found:
+                history.mark_unknown_hash(hash_value)
+                unknown += 1
+
+    summary = {
+        'files': len(files),
+        'hashed': len(hashes),
+        'known': known,
+        'identified': identified,
+        'unknown': unknown,
+        'failed': failed,
+        'hash_seconds': round(hashed_at - started, 2),
+        'total_seconds': round(time.monotonic() - started, 2),
+    }
+    print(f"{MSG_PREFIX}Indexed {summary['files']} files: {known} already known, {identified} identified, {unknown} unknown on CivitAI, {failed} not looked up ({summary['total_seconds']}s)")
+    return summary
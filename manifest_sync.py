@@ -0,0 +1,191 @@
+import concurrent.futures
+import json
+import os
+import time
+
+from .CivitAI_Model import CivitAI_Model, MSG_PREFIX, WARN_PREFIX, ERR_PREFIX
+from .disk_quota import pin_air
+from .download_lock import single_flight
+from .download_history import get_download_history
+from .hash_cache import get_hash_cache
+from .metrics import get_metrics
+from .prefetch import MODEL_TYPES, resolve_download_path
+from .utils import folder_roots, parse_air
+
+
+DEFAULT_WORKERS = 4
+
+# Byte sizes in the API are `sizeKB` floats; anything within a KiB counts as the same size
+SIZE_TOLERANCE = 1024
+
+
+# READ A MANIFEST
+
+def manifest_folder(model_type):
+    '''Route a CivitAI model type (`Checkpoint`, `LORA`, ...) or folder name to its `folder_paths` folder.'''
+    name = str(model_type).strip().lower()
+    for folder, model_types in MODEL_TYPES.items():
+        if name == folder or name in (t.lower() for t in model_types):
+            return folder
+    raise ValueError(f"Unknown model type `{model_type}`, expected one of: {', '.join(t for types in MODEL_TYPES.values() for t in types)}")
+
+
+def read_manifest(manifest_path):
+    '''
+    Returns [(folder, model_id, version_id)] from a manifest file. Text
+    manifests list one `<type> <air>` per line (`#` starts a comment); JSON
+    manifests are either `{"<type>": ["<air>", ...]}` or a list of
+    `{"type": ..., "air": ...}` objects. Repeated AIRs are listed once.
+    '''
+    with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+        content = manifest_file.read()
+
+    pairs = []
+    if manifest_path.lower().endswith('.json'):
+        data = json.loads(content)
+        if isinstance(data, dict):
+            for model_type, airs in data.items():
+                pairs.extend((model_type, air) for air in airs)
+        else:
+            pairs.extend((item.get('type'), item.get('air')) for item in data)
+    else:
+        for number, line in enumerate(content.splitlines(), 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            fields = line.split()
+            if len(fields) != 2:
+                raise ValueError(f"Line {number} of `{manifest_path}` should be `<type> <air>`: {line}")
+            pairs.append(tuple(fields))
+
+    entries = []
+    for model_type, air in pairs:
+        folder = manifest_folder(model_type)
+        model_id, version_id = parse_air(str(air).strip())
+        entry = (folder, model_id, version_id)
+        if entry not in entries:
+            entries.append(entry)
+    return entries
+
+
+# DIFF AGAINST DISK AND HISTORY
+
+def local_state(folder, model_id, version_id=None):
+    '''
+    Returns (`synced` | `changed` | `missing`, path) for one manifest entry
+    using only the download history, `stat` and the hash cache; nothing is
+    hashed or requested. A changed file is one whose size differs from the
+    recorded one or that was modified since it was last hashed. An AIR
+    without a version is synced by any recorded file of that model on disk.
+    '''
+    version_id = int(version_id) if version_id else None
+    for version, file_details in get_download_history().model_files(model_id):
+        if version_id and version != version_id:
+            continue
+        name = file_details.get('name')
+        if not name:
+            continue
+        for path in folder_roots(folder):
+            full_path = os.path.join(path, name)
+            try:
+                size = os.stat(full_path).st_size
+            except OSError:
+                continue
+            expected_size = file_details.get('sizeKB', 0) * 1024
+            expected_sha256 = (file_details.get('hashes') or {}).get('SHA256')
+            if size <= 0 or (expected_size and abs(size - expected_size) >= SIZE_TOLERANCE):
+                return 'changed', full_path
+            # Modified since it was last hashed, or hashed to something other than the recorded file
+            hash_cache = get_hash_cache()
+            cached_sha256 = hash_cache.get(full_path)
+            if hash_cache.modified(full_path) or (cached_sha256 and expected_sha256 and cached_sha256.upper() != expected_sha256.upper()):
+                return 'changed', full_path
+            return 'synced', full_path
+    return 'missing', None
+
+
+# FETCH ONE ENTRY
+
+def sync_entry(folder, model_id, version_id, path=None, token=None, download_path=None, download_chunks=None):
+    civitai_model = CivitAI_Model(
+        model_id=model_id,
+        model_version=version_id,
+        model_types=MODEL_TYPES[folder],
+        token=token,
+        save_path=resolve_download_path(folder, download_path),
+        model_paths=folder_roots(folder),
+        download_chunks=download_chunks,
+    )
+    if path:
+        # The file on disk differs from its recorded size or hash, download it again in place,
+        # sharing the flight a loader node may already have started for the same file
+        return single_flight(os.path.realpath(path), lambda: civitai_model.download_file(path))
+    return civitai_model.download()
+
+
+def downloaded_bytes():
+    return sum(counter['value'] for counter in get_metrics().snapshot()['counters'] if counter['name'] == 'downloaded_bytes')
+
+
+# SYNC ENTRY POINT
+
+def sync_manifest(manifest_path, token=None, workers=DEFAULT_WORKERS, download_path=None, download_chunks=None, pin=False, dry_run=False):
+    '''
+    Make the model folders match a manifest of AIRs: entries already on disk
+    are checked with `stat` calls only, and the missing or changed ones are
+    downloaded concurrently. Running it again on a synced node downloads
+    nothing. Returns a summary dict.
+    '''
+    started = time.monotonic()
+    entries = read_manifest(manifest_path)
+
+    pending = []
+    synced = 0
+    for folder, model_id, version_id in entries:
+        state, path = local_state(folder, model_id, version_id)
+        if state == 'synced':
+            synced += 1
+            continue
+        air = f"{model_id}@{version_id}" if version_id else str(model_id)
+        print(f"{MSG_PREFIX}{'Missing' if state == 'missing' else 'Changed'} {folder[:-1]}: {air}{f' ({path})' if path else ''}")
+        pending.append((folder, model_id, version_id, path))
+
+    print(f"{MSG_PREFIX}Manifest lists {len(entries)} models: {synced} in sync, {len(pending)} to download")
+
+    failed = []
+    bytes_before = downloaded_bytes()
+    if pending and not dry_run:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(workers, len(pending)))) as executor:
+            futures = {
+                executor.submit(sync_entry, folder, model_id, version_id, path, token, download_path, download_chunks): (folder, model_id, version_id)
+                for folder, model_id, version_id, path in pending
+            }
+            for future in concurrent.futures.as_completed(futures):
+                folder, model_id, version_id = futures[future]
+                air = f"{model_id}@{version_id}" if version_id else str(model_id)
+                try:
+                    if not future.result():
+                        raise Exception("download did not complete")
+                except Exception as e:
+                    print(f"{ERR_PREFIX}Unable to sync `{air}`: {e}")
+                    failed.append(air)
+
+    if pin and not dry_run:
+        for folder, model_id, version_id in entries:
+            pin_air(f"{model_id}@{version_id}" if version_id else str(model_id))
+
+    summary = {
+        'models': len(entries),
+        'synced': synced,
+        'downloaded': 0 if dry_run else len(pending) - len(failed),
+        'failed': failed,
+        'pending': [f"{model_id}@{version_id}" if version_id else str(model_id) for _, model_id, version_id, _ in pending] if dry_run else [],
+        'bytes': downloaded_bytes() - bytes_before,
+        'total_seconds': round(time.monotonic() - started, 2),
+    }
+    elapsed = max(summary['total_seconds'], 0.01)
+    print(f"{MSG_PREFIX}Synced {summary['models']} models: {synced} already present, {summary['downloaded']} downloaded, {len(failed)} failed, "
+          f"{summary['bytes'] / 1024 ** 2:.1f} MiB in {summary['total_seconds']}s ({summary['bytes'] / 1024 ** 2 / elapsed:.1f} MiB/s)")
+    if failed:
+        print(f"{WARN_PREFIX}Re-run the sync to retry: {', '.join(failed)}")
+    return summary
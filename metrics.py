@@ -0,0 +1,253 @@
+import contextlib
+import functools
+import importlib
+import json
+import os
+import threading
+import time
+
+
+WARN_PREFIX = '\33[1m\33[34m[CivitAI]\33[0m\33[93m Warning: \33[0m'
+
+METRIC_PREFIX = 'civitai_'
+
+
+class MetricsRegistry:
+    '''
+    Process-wide counters, timers and gauges for the CivitAI nodes
+
+    Every `inc` and `observe` updates an in-memory aggregate and is emitted as
+    a structured event `{'type', 'name', 'value', 'labels', 'time'}` to the
+    registered hooks, so operators can forward it to their own tracing or
+    logging. The aggregates are served in Prometheus text format on
+    `/civitai/metrics` of the ComfyUI server. Gauges hold the latest value of
+    something in progress, such as a download's throughput, and are only
+    exported, not emitted.
+    '''
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self.gauges = {}
+        self.hooks = []
+        self.lock = threading.Lock()
+
+    # HOOKS
+
+    def add_hook(self, hook):
+        '''Call `hook(event)` for every counter increment and timing.'''
+        with self.lock:
+            self.hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook):
+        with self.lock:
+            if hook in self.hooks:
+                self.hooks.remove(hook)
+
+    def emit(self, event):
+        for hook in list(self.hooks):
+            try:
+                hook(event)
+            except Exception as e:
+                print(f"{WARN_PREFIX}Metrics hook {getattr(hook, '__name__', hook)} failed: {e}")
+
+    # RECORDING
+
+    @staticmethod
+    def key(name, labels):
+        return (name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None)))
+
+    def inc(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        if self.hooks:
+            self.emit({'type': 'counter', 'name': name, 'value': value, 'labels': dict(key[1]), 'time': time.time()})
+
+    def observe(self, name, seconds, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            count, total, maximum = self.timers.get(key, (0, 0.0, 0.0))
+            self.timers[key] = (count + 1, total + seconds, max(maximum, seconds))
+        if self.hooks:
+            self.emit({'type': 'timer', 'name': name, 'value': seconds, 'labels': dict(key[1]), 'time': time.time()})
+
+    def set_gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def clear_gauge(self, name, **labels):
+        with self.lock:
+            self.gauges.pop(self.key(name, labels), None)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        outcome = 'ok'
+        try:
+            yield
+        except BaseException:
+            outcome = 'error'
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, outcome=outcome, **labels)
+
+    # EXPORT
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in self.counters.items()],
+                'timers': [
+                    {'name': name, 'labels': dict(labels), 'count': count, 'sum': total, 'max': maximum}
+                    for (name, labels), (count, total, maximum) in self.timers.items()
+                ],
+                'gauges': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in self.gauges.items()],
+            }
+
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ''
+        escaped = (
+            f'{k}="' + v.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') + '"'
+            for k, v in labels
+        )
+        return '{' + ','.join(escaped) + '}'
+
+    def render_prometheus(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            timers = sorted(self.timers.items())
+            gauges = sorted(self.gauges.items())
+
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f'{METRIC_PREFIX}{name}_total'
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric}{self.format_labels(labels)} {value}')
+        # Each summary family is written whole, followed by its `_max` gauge family
+        for name in sorted({name for (name, _), _ in timers}):
+            metric = f'{METRIC_PREFIX}{name}_seconds'
+            series = [(labels, values) for (timer_name, labels), values in timers if timer_name == name]
+            lines.append(f'# TYPE {metric} summary')
+            for labels, (count, total, _) in series:
+                lines.append(f'{metric}_count{self.format_labels(labels)} {count}')
+                lines.append(f'{metric}_sum{self.format_labels(labels)} {total:.6f}')
+            lines.append(f'# TYPE {metric}_max gauge')
+            for labels, (_, _, maximum) in series:
+                lines.append(f'{metric}_max{self.format_labels(labels)} {maximum:.6f}')
+        for (name, labels), value in gauges:
+            metric = f'{METRIC_PREFIX}{name}'
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f'# TYPE {metric} gauge')
+            lines.append(f'{metric}{self.format_labels(labels)} {value:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.timers.clear()
+            self.gauges.clear()
+
+
+# JSON LINES EVENT LOG
+
+class EventLog:
+    '''Hook that appends every event as one JSON line, enabled with `CIVITAI_EVENTS_LOG=<path>`.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event) + '\n'
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as log_file:
+                log_file.write(line)
+
+
+def load_hook(spec):
+    '''The callable named by a `module:function` spec, imported from `sys.path`.'''
+    module_name, _, attribute = spec.strip().partition(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                metrics = MetricsRegistry()
+                if os.environ.get('CIVITAI_EVENTS_LOG'):
+                    metrics.add_hook(EventLog(os.environ['CIVITAI_EVENTS_LOG']))
+                # Hooks named here are registered on the registry the nodes actually record into
+                for spec in filter(None, os.environ.get('CIVITAI_METRICS_HOOKS', '').split(',')):
+                    try:
+                        metrics.add_hook(load_hook(spec))
+                    except Exception as e:
+                        print(f"{WARN_PREFIX}Unable to load metrics hook `{spec.strip()}`: {e}")
+                _metrics = metrics
+    return _metrics
+
+
+def inc(name, value=1, **labels):
+    get_metrics().inc(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    get_metrics().observe(name, seconds, **labels)
+
+
+def set_gauge(name, value, **labels):
+    get_metrics().set_gauge(name, value, **labels)
+
+
+def clear_gauge(name, **labels):
+    get_metrics().clear_gauge(name, **labels)
+
+
+def timer(name, **labels):
+    return get_metrics().timer(name, **labels)
+
+
+def timed(name, **labels):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with get_metrics().timer(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_hook(hook):
+    return get_metrics().add_hook(hook)
+
+
+def remove_hook(hook):
+    get_metrics().remove_hook(hook)
+
+
+# COMFYUI SERVER ROUTE
+
+def add_routes(prompt_server):
+    '''Serve the registry on `/civitai/metrics` (Prometheus text) and `/civitai/metrics.json`.'''
+    from aiohttp import web
+
+    @prompt_server.routes.get('/civitai/metrics')
+    async def metrics_prometheus(request):
+        return web.Response(text=get_metrics().render_prometheus(), content_type='text/plain', charset='utf-8')
+
+    @prompt_server.routes.get('/civitai/metrics.json')
+    async def metrics_json(request):
+        return web.json_response(get_metrics().snapshot())
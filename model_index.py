@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+
+from .download_journal import JOURNAL_SUFFIX, PART_SUFFIX
+from .download_lock import LOCK_SUFFIX
+
+
+# Partial downloads and their lock files must never resolve as models
+IN_PROGRESS_SUFFIXES = (PART_SUFFIX, JOURNAL_SUFFIX, JOURNAL_SUFFIX + '.tmp', LOCK_SUFFIX)
+
+
+class ModelIndex:
+    '''
+    Cached filename -> path index over a list of model roots
+
+    Built with one walk of the roots and kept valid by comparing directory
+    mtimes, which change whenever entries are added to or removed from a
+    directory. Keys are the lower-cased filename with and without extension,
+    and the first file in walk order wins, matching `utils.model_path`.
+    '''
+    check_interval = 2.0
+
+    def __init__(self, search_paths):
+        self.search_paths = [path for path in search_paths if path]
+        self.entries = {}
+        self.dir_mtimes = {}
+        self.last_check = 0
+        self.built = False
+        self.lock = threading.RLock()
+
+    # BUILD
+
+    @staticmethod
+    def keys(file):
+        name, ext = os.path.splitext(file)
+        return (name.lower().strip(), (name + ext).lower().strip())
+
+    def build(self):
+        entries = {}
+        dir_mtimes = {}
+        for path in self.search_paths:
+            for root, dirs, files in os.walk(path):
+                try:
+                    dir_mtimes[root] = os.stat(root).st_mtime_ns
+                except OSError:
+                    continue
+                for file in files:
+                    if file.endswith(IN_PROGRESS_SUFFIXES):
+                        continue
+                    full_path = os.path.join(root, file)
+                    for key in self.keys(file):
+                        entries.setdefault(key, full_path)
+        with self.lock:
+            self.entries = entries
+            self.dir_mtimes = dir_mtimes
+            self.last_check = time.monotonic()
+            self.built = True
+
+    def stale(self):
+        for root, mtime in self.dir_mtimes.items():
+            try:
+                if os.stat(root).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        # A root that did not exist at build time may have been created since
+        return any(path not in self.dir_mtimes and os.path.isdir(path) for path in self.search_paths)
+
+    def validate(self, force=False):
+        with self.lock:
+            if not self.built:
+                self.build()
+                return
+            if not force and time.monotonic() - self.last_check < self.check_interval:
+                return
+            self.last_check = time.monotonic()
+            if self.stale():
+                self.build()
+
+    # LOOKUP
+
+    def find(self, filename):
+        if not filename:
+            return None
+        key = filename.lower().strip()
+        self.validate()
+        path = self.entries.get(key)
+        if path and os.path.exists(path):
+            return path
+        # Miss or vanished file: make sure the index reflects the disk before giving up
+        self.validate(force=True)
+        return self.entries.get(key)
+
+    # IN-PLACE UPDATES
+
+    def covers(self, file_path):
+        directory = os.path.abspath(os.path.dirname(file_path))
+        return any(
+            directory == os.path.abspath(path) or directory.startswith(os.path.abspath(path) + os.sep)
+            for path in self.search_paths
+        )
+
+    def add(self, file_path):
+        with self.lock:
+            if not self.built or not self.covers(file_path):
+                return
+            for key in self.keys(os.path.basename(file_path)):
+                self.entries.setdefault(key, file_path)
+            directory = os.path.dirname(file_path)
+            if directory in self.dir_mtimes:
+                try:
+                    self.dir_mtimes[directory] = os.stat(directory).st_mtime_ns
+                except OSError:
+                    pass
+
+    def remove(self, file_path):
+        with self.lock:
+            for key in self.keys(os.path.basename(file_path)):
+                if self.entries.get(key) == file_path:
+                    del self.entries[key]
+            # Another file may share the key, let the next lookup rebuild
+            self.last_check = 0
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_model_index(search_paths):
+    key = tuple(search_paths)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(key, ModelIndex(search_paths))
+    return index
+
+
+def index_file(file_path):
+    '''Record a newly written model file in every index whose roots contain it.'''
+    for index in list(_indexes.values()):
+        index.add(file_path)
+
+
+def forget_file(file_path):
+    for index in list(_indexes.values()):
+        if index.covers(file_path):
+            index.remove(file_path)
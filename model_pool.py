@@ -0,0 +1,131 @@
+import collections
+import os
+import threading
+
+from .metrics import inc
+from .utils import parse_size
+
+
+def estimate_size(value):
+    '''
+    Approximate resident bytes of a loaded model object: ComfyUI model
+    patchers report their own size, VAEs are summed over their parameters and
+    tensors (alone or in tuples, lists and dicts) over their elements.
+    '''
+    if value is None:
+        return 0
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(estimate_size(item) for item in value.values())
+    if hasattr(value, 'model_size'):
+        return value.model_size()
+    if hasattr(value, 'patcher'):
+        return estimate_size(value.patcher)
+    if hasattr(value, 'first_stage_model'):
+        module = value.first_stage_model
+        return sum(estimate_size(tensor) for tensor in list(module.parameters()) + list(module.buffers()))
+    if hasattr(value, 'element_size') and hasattr(value, 'nelement'):
+        return value.element_size() * value.nelement()
+    return 0
+
+
+class ModelPool:
+    '''
+    Byte-budgeted LRU pool of loaded models keyed by file SHA256
+
+    Keeps recently loaded models in memory so that a workflow switching back
+    to one skips reading and deserializing it again. The least recently used
+    entries are dropped once the pool holds more than `max_bytes`; a budget of
+    0 disables the pool. Hits, misses and evictions are counted for `stats()`
+    and the metrics registry.
+    '''
+
+    def __init__(self, name, max_bytes=0):
+        self.name = name
+        self.max_bytes = max_bytes or 0
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, sha256):
+        if not self.enabled or not sha256:
+            return None
+        with self.lock:
+            entry = self.entries.get(sha256)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(sha256)
+                self.hits += 1
+        inc('model_pool', pool=self.name, result='hit' if entry else 'miss')
+        return entry[0] if entry else None
+
+    def put(self, sha256, value, size=None):
+        if not self.enabled or not sha256:
+            return
+        size = estimate_size(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        evicted = []
+        with self.lock:
+            previous = self.entries.pop(sha256, None)
+            if previous:
+                self.total_bytes -= previous[1]
+            self.entries[sha256] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                key, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+                evicted.append(key)
+        for key in evicted:
+            inc('model_pool', pool=self.name, result='eviction')
+
+    def discard(self, sha256):
+        with self.lock:
+            entry = self.entries.pop(sha256, None)
+            if entry:
+                self.total_bytes -= entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_model_pool(name, default=None):
+    '''
+    The pool for a folder type, e.g. `checkpoints`, with its budget from
+    `CIVITAI_POOL_<NAME>` (e.g. `CIVITAI_POOL_CHECKPOINTS=16G`) or `default`.
+    '''
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            budget = os.environ.get(f'CIVITAI_POOL_{name.upper()}', default)
+            pool = _pools[name] = ModelPool(name, parse_size(budget))
+        return pool
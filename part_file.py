@@ -0,0 +1,66 @@
+import errno
+import os
+import threading
+
+
+O_BINARY = getattr(os, 'O_BINARY', 0)
+
+
+def preallocate(path, size):
+    '''
+    Create (or truncate) `path` with `size` bytes reserved. Uses
+    `posix_fallocate` where the platform and filesystem support it, so the
+    blocks are allocated up front instead of growing a sparse file piece by
+    piece; elsewhere the file is simply extended to its final size.
+    '''
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | O_BINARY, 0o644)
+    try:
+        if size > 0 and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, size)
+                return
+            except OSError as e:
+                # Out of space is a real error; anything else means no fallocate support here
+                if e.errno == errno.ENOSPC:
+                    raise
+        os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+class PartFile:
+    '''
+    One shared descriptor for every chunk worker of a download
+
+    Workers write at absolute offsets with `os.pwrite`, so there is no seek
+    position to share and no per-worker open and close. Platforms without
+    `pwrite` (Windows) fall back to seek + write under a lock.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | O_BINARY)
+        self.lock = None if hasattr(os, 'pwrite') else threading.Lock()
+
+    def pwrite(self, data, offset):
+        view = memoryview(data)
+        while view:
+            if self.lock is None:
+                written = os.pwrite(self.fd, view, offset)
+            else:
+                with self.lock:
+                    os.lseek(self.fd, offset, os.SEEK_SET)
+                    written = os.write(self.fd, view)
+            view = view[written:]
+            offset += written
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
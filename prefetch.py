@@ -0,0 +1,239 @@
+import concurrent.futures
+import os
+import threading
+
+from .download_budget import PRIORITY_FOREGROUND, PRIORITY_PREFETCH
+from .utils import folder_roots, short_paths_map, model_path, parse_air, parse_lora_stack
+
+
+# Node inputs that name an AIR, and the folder type each one is routed to
+LOADER_INPUTS = {
+    'CivitAI_Checkpoint_Loader': ('ckpt_air', 'ckpt_name', 'checkpoints'),
+    'CivitAI_Lora_Loader': ('lora_air', 'lora_name', 'loras'),
+}
+# Node inputs that hold a whole list of `air:strength_model:strength_clip` entries
+STACK_INPUTS = {
+    'CivitAI_Lora_Stack': ('lora_stack', 'loras'),
+}
+EXTRA_AIRS = {
+    'ckpt_airs': 'checkpoints',
+    'lora_airs': 'loras',
+}
+MODEL_TYPES = {
+    'checkpoints': ["Checkpoint"],
+    'loras': ["LORA", "LoCon"],
+}
+
+MAX_PREFETCH_WORKERS = 4
+
+MSG_PREFIX = '\33[1m\33[34m[CivitAI] \33[0m'
+WARN_PREFIX = '\33[1m\33[34m[CivitAI]\33[0m\33[93m Warning: \33[0m'
+
+_executor = None
+_inflight = {}
+_models = {}
+_promoted = set()
+_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_PREFETCH_WORKERS, thread_name_prefix='civitai-prefetch')
+    return _executor
+
+
+# FETCH ONE AIR
+
+def resolve_download_path(folder, download_path=None):
+    model_paths = folder_roots(folder)
+    if download_path:
+        return short_paths_map(model_paths).get(download_path, model_paths[0])
+    return model_paths[0]
+
+
+def fetch(folder, model_id, version_id, token=None, download_path=None, download_chunks=None):
+    from .CivitAI_Model import CivitAI_Model
+
+    key = (folder, model_id, version_id)
+    with _lock:
+        priority = PRIORITY_FOREGROUND if key in _promoted else PRIORITY_PREFETCH
+    civitai_model = CivitAI_Model(
+        model_id=model_id,
+        model_version=version_id,
+        model_types=MODEL_TYPES[folder],
+        token=token,
+        save_path=resolve_download_path(folder, download_path),
+        model_paths=folder_roots(folder),
+        download_chunks=download_chunks,
+        priority=priority,
+    )
+    with _lock:
+        _models[key] = civitai_model
+        if key in _promoted:
+            civitai_model.priority = PRIORITY_FOREGROUND
+    civitai_model.download()
+    return civitai_model
+
+
+def prefetch(folder, model_id, version_id=None, token=None, download_path=None, download_chunks=None):
+    '''
+    Start resolving and downloading an AIR in the background. Returns the
+    in-flight future; a second request for the same AIR shares it.
+    '''
+    if not model_id:
+        return None
+    key = (folder, model_id, version_id)
+    with _lock:
+        future = _inflight.get(key)
+        if future:
+            return future
+        future = executor().submit(fetch, folder, model_id, version_id, token, download_path, download_chunks)
+        _inflight[key] = future
+
+    def done(future):
+        with _lock:
+            if _inflight.get(key) is future:
+                del _inflight[key]
+                _models.pop(key, None)
+                _promoted.discard(key)
+        if not future.cancelled() and future.exception():
+            print(f"{WARN_PREFIX}Prefetch of `{model_id}@{version_id or ''}` failed: {future.exception()}")
+
+    future.add_done_callback(done)
+    return future
+
+
+def wait(folder, model_id, version_id=None):
+    '''
+    Called by the loader nodes before they download an AIR, which a prefetch
+    started when the prompt was queued may already be fetching. Make sure
+    that prefetch (if any) doesn't hold up the node. A job
+    still queued behind other prefetches is cancelled, leaving the node's own
+    download to fetch it inline at foreground priority; a running one is
+    promoted to foreground priority and waited for. Failures are left for the
+    node's own download attempt to report.
+    '''
+    key = (folder, model_id, version_id)
+    with _lock:
+        future = _inflight.get(key)
+    if not future or future.cancel():
+        return
+    with _lock:
+        if _inflight.get(key) is future:
+            _promoted.add(key)
+            if key in _models:
+                _models[key].priority = PRIORITY_FOREGROUND
+    print(f"{MSG_PREFIX}Waiting for prefetch of `{model_id}@{version_id or ''}`")
+    try:
+        future.result()
+    except Exception:
+        pass
+
+
+# SCAN A SUBMITTED PROMPT
+
+def on_disk(folder, model_id, version_id=None):
+    '''
+    True if a file of this AIR is already in `folder`: one a loader recorded
+    loading or downloading, whatever it is named now, or a recorded file of
+    the model found by name in any of the folder's subfolders.
+    '''
+    from .download_history import get_download_history
+
+    version_id = int(version_id) if version_id else None
+    history = get_download_history()
+    for path, used_version_id in history.used_files(model_id):
+        if (not version_id or used_version_id == version_id) and os.path.isfile(path):
+            return True
+    for version, file_details in history.model_files(model_id):
+        if version_id and version != version_id:
+            continue
+        if model_path(file_details.get('name'), folder_roots(folder)):
+            return True
+    return False
+
+
+def prompt_airs(json_data):
+    '''
+    Yields (folder, model_id, version_id, options) for every AIR referenced by
+    the prompt's loader nodes and by the workflow's recorded AIR lists.
+    '''
+    prompt = json_data.get('prompt') or {}
+    tokens = {}
+
+    for node in prompt.values():
+        inputs = node.get('inputs') or {}
+        options = {
+            'token': inputs.get('api_key') if isinstance(inputs.get('api_key'), str) else None,
+            'download_path': inputs.get('download_path') if isinstance(inputs.get('download_path'), str) else None,
+            'download_chunks': inputs.get('download_chunks') if isinstance(inputs.get('download_chunks'), int) else None,
+        }
+
+        stack = STACK_INPUTS.get(node.get('class_type'))
+        if stack:
+            stack_input, folder = stack
+            if options['token']:
+                tokens.setdefault(folder, options['token'])
+            try:
+                entries = parse_lora_stack(inputs.get(stack_input)) if isinstance(inputs.get(stack_input), str) else []
+            except ValueError:
+                entries = []
+            for air, _, _ in entries:
+                model_id, version_id = parse_air(air)
+                yield folder, model_id, version_id, options
+            continue
+
+        loader = LOADER_INPUTS.get(node.get('class_type'))
+        if not loader:
+            continue
+        air_input, name_input, folder = loader
+        api_key = inputs.get('api_key')
+        if isinstance(api_key, str) and api_key:
+            tokens.setdefault(folder, api_key)
+
+        # Only AIRs that the node will actually download; a local file name wins over the AIR
+        air = inputs.get(air_input)
+        if not isinstance(air, str) or inputs.get(name_input) != 'none':
+            continue
+        try:
+            model_id, version_id = parse_air(air.strip())
+        except ValueError:
+            continue
+        yield folder, model_id, version_id, options
+
+    # The recorded lists also hold AIRs of models loaded from disk by name; only fetch the ones not on disk
+    extra_pnginfo = (json_data.get('extra_data') or {}).get('extra_pnginfo') or {}
+    extra = (extra_pnginfo.get('workflow') or {}).get('extra') or {}
+    for list_key, folder in EXTRA_AIRS.items():
+        for air in extra.get(list_key) or []:
+            if not isinstance(air, str):
+                continue
+            try:
+                model_id, version_id = parse_air(air.strip())
+            except ValueError:
+                continue
+            if on_disk(folder, model_id, version_id):
+                continue
+            yield folder, model_id, version_id, {'token': tokens.get(folder)}
+
+
+def prefetch_prompt(json_data):
+    futures = []
+    for folder, model_id, version_id, options in prompt_airs(json_data):
+        future = prefetch(folder, model_id, version_id, **options)
+        if future:
+            futures.append(future)
+    return futures
+
+
+def on_prompt(json_data):
+    '''
+    `PromptServer` on-prompt handler: kicks off every download the prompt will
+    need before the graph starts executing.
+    '''
+    try:
+        prefetch_prompt(json_data)
+    except Exception as e:
+        print(f"{WARN_PREFIX}Unable to prefetch prompt models: {e}")
+    return json_data
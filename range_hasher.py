@@ -0,0 +1,104 @@
+import hashlib
+import heapq
+import threading
+
+
+class RangeHasher:
+    '''
+    Incremental SHA256 of a file that is being written out of order
+
+    Download workers report every byte range they have written with `mark()`.
+    A background thread hashes the contiguous prefix of the file as it grows,
+    reading it back while it is still in the page cache, so the digest is
+    ready (or nearly so) when the last byte lands.
+    '''
+    block_size = 1024 * 1024
+
+    def __init__(self, file_path, total_size):
+        self.file_path = file_path
+        self.total_size = total_size
+        self.sha256_hash = hashlib.sha256()
+        self.pending = []
+        self.frontier = 0
+        self.hashed = 0
+        self.aborted = False
+        self.closed = False
+        self.error = None
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name='civitai-range-hasher', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    # RECORD A WRITTEN RANGE
+
+    def mark(self, start, length):
+        if length <= 0:
+            return
+        with self.condition:
+            end = start + length
+            if start <= self.frontier:
+                self.frontier = max(self.frontier, end)
+            else:
+                heapq.heappush(self.pending, (start, end))
+            while self.pending and self.pending[0][0] <= self.frontier:
+                _, pending_end = heapq.heappop(self.pending)
+                self.frontier = max(self.frontier, pending_end)
+            self.condition.notify_all()
+
+    # HASH CONTIGUOUS PREFIX
+
+    def run(self):
+        if self.total_size <= 0:
+            return
+        try:
+            with open(self.file_path, 'rb') as file:
+                while True:
+                    with self.condition:
+                        while not self.aborted and not self.closed and self.frontier <= self.hashed:
+                            self.condition.wait()
+                        if self.aborted or self.frontier <= self.hashed:
+                            return
+                        target = min(self.frontier, self.total_size)
+
+                    file.seek(self.hashed)
+                    while self.hashed < target:
+                        block = file.read(min(self.block_size, target - self.hashed))
+                        if not block:
+                            raise IOError(f"Unexpected end of file while hashing `{self.file_path}`")
+                        self.sha256_hash.update(block)
+                        self.hashed += len(block)
+
+                    if self.hashed >= self.total_size:
+                        with self.condition:
+                            self.condition.notify_all()
+                        return
+        except Exception as e:
+            with self.condition:
+                self.error = e
+                self.aborted = True
+                self.condition.notify_all()
+
+    # RESULT
+
+    def finish(self):
+        '''
+        Wait for the writers' ranges to be hashed. Returns None if the
+        marked ranges never covered the whole file.
+        '''
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        if self.error:
+            raise self.error
+        if self.hashed < self.total_size:
+            return None
+        return self.sha256_hash.hexdigest().upper()
+
+    def abort(self):
+        with self.condition:
+            self.aborted = True
+            self.condition.notify_all()
+        self.thread.join()
@@ -0,0 +1,188 @@
+import collections
+import threading
+import time
+
+
+class Segment:
+    '''
+    A byte range of the download owned by one worker
+
+    `end` is inclusive and may shrink while the segment is being downloaded
+    when an idle worker steals its tail.
+    '''
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.position = start
+        self.owner = None
+        self.started_at = None
+        self.received = 0
+
+    @property
+    def remaining(self):
+        return max(0, self.end - self.position + 1)
+
+    def rate(self):
+        if not self.started_at:
+            return 0
+        elapsed = time.monotonic() - self.started_at
+        return self.received / elapsed if elapsed > 0 else 0
+
+
+class RangeScheduler:
+    '''
+    Adaptive, work-stealing range scheduler for chunked downloads
+
+    The file is split into many small segments in a shared queue. Workers take
+    segments until the queue is empty, then steal the back half of whichever
+    active segment would take longest to finish at its measured rate. The
+    number of workers allowed to hold a connection is tuned between
+    `min_workers` and `max_workers` by hill climbing on aggregate throughput.
+    '''
+    min_segment_size = 8 * 1024 * 1024
+    segments_per_worker = 16
+    min_steal_size = 1024 * 1024
+    sample_interval = 2.0
+
+    def __init__(self, total_size, max_workers, segment_size=None, min_workers=1, initial_workers=None, steal=True, adaptive=True, ranges=None):
+        self.total_size = total_size
+        self.max_workers = max(1, int(max_workers))
+        self.min_workers = max(1, min(int(min_workers), self.max_workers))
+        self.steal = steal
+        self.adaptive = adaptive
+
+        if not segment_size:
+            segment_size = max(self.min_segment_size, total_size // (self.max_workers * self.segments_per_worker) if total_size else 0)
+        self.segment_size = max(1, int(segment_size))
+
+        # `ranges` limits the download to these inclusive (start, end) spans, e.g. when resuming
+        if ranges is None:
+            ranges = [(0, total_size - 1)] if total_size else []
+
+        self.queue = collections.deque()
+        for range_start, range_end in ranges:
+            for start in range(range_start, range_end + 1, self.segment_size):
+                self.queue.append(Segment(start, min(start + self.segment_size - 1, range_end)))
+
+        self.active = set()
+        self.running = 0
+        self.received = 0
+        self.failed = False
+        self.condition = threading.Condition()
+
+        if initial_workers is None:
+            initial_workers = min(2, self.max_workers) if adaptive else self.max_workers
+        self.target = max(self.min_workers, min(int(initial_workers), self.max_workers))
+
+        self.last_sample_time = time.monotonic()
+        self.last_sample_bytes = 0
+        self.last_rate = 0
+        self.direction = 1
+
+    # WORK DISTRIBUTION
+
+    def acquire(self, worker_id):
+        '''
+        Block until this worker may hold a connection and return its next
+        segment, or None once there is nothing left to download.
+        '''
+        with self.condition:
+            while True:
+                if self.failed or self.done():
+                    return None
+                if self.running < self.target:
+                    segment = self.next_segment()
+                    if segment is None:
+                        return None
+                    segment.owner = worker_id
+                    segment.started_at = time.monotonic()
+                    self.active.add(segment)
+                    self.running += 1
+                    return segment
+                self.condition.wait(self.sample_interval)
+
+    def release(self, segment):
+        with self.condition:
+            self.active.discard(segment)
+            self.running -= 1
+            self.condition.notify_all()
+
+    def next_segment(self):
+        if self.queue:
+            return self.queue.popleft()
+        if not self.steal:
+            return None
+
+        # Steal from the active segment with the longest estimated time left
+        victim = None
+        victim_eta = 0
+        for segment in self.active:
+            if segment.remaining < self.min_steal_size * 2:
+                continue
+            rate = segment.rate()
+            eta = segment.remaining / rate if rate > 0 else float('inf')
+            if victim is None or eta > victim_eta:
+                victim = segment
+                victim_eta = eta
+        if victim is None:
+            return None
+
+        split = victim.position + victim.remaining // 2
+        stolen = Segment(split, victim.end)
+        victim.end = split - 1
+        return stolen
+
+    def claim(self, segment, offset, length):
+        '''
+        Record `length` bytes received at `offset` for `segment` and return how
+        many of them still belong to it (its tail may have been stolen).
+        '''
+        with self.condition:
+            if offset != segment.position:
+                return 0
+            length = max(0, min(length, segment.end - offset + 1))
+            segment.position += length
+            segment.received += length
+            self.received += length
+            return length
+
+    def fail(self):
+        with self.condition:
+            self.failed = True
+            self.condition.notify_all()
+
+    def done(self):
+        return not self.queue and not self.active
+
+    # CONCURRENCY CONTROL
+
+    def adjust(self):
+        '''
+        Sample aggregate throughput and move the worker target one step in
+        whichever direction last improved it. Called periodically by the
+        thread that waits on the workers.
+        '''
+        if not self.adaptive:
+            return self.target
+
+        with self.condition:
+            now = time.monotonic()
+            elapsed = now - self.last_sample_time
+            if elapsed < self.sample_interval:
+                return self.target
+
+            rate = (self.received - self.last_sample_bytes) / elapsed
+            self.last_sample_time = now
+            self.last_sample_bytes = self.received
+
+            if self.last_rate and rate < self.last_rate * 0.95:
+                self.direction = -self.direction
+            elif self.last_rate and rate < self.last_rate * 1.05:
+                self.last_rate = rate
+                return self.target
+
+            self.last_rate = rate
+            self.target = max(self.min_workers, min(self.target + self.direction, self.max_workers))
+            self.condition.notify_all()
+            return self.target
@@ -1,4 +1,14 @@
 import os
+import re
+
+import folder_paths
+
+from .metrics import timed
+from .model_index import get_model_index
+
+def folder_roots(folder):
+    '''Model roots of a `folder_paths` folder type, read when needed so paths registered after import are seen.'''
+    return folder_paths.folder_names_and_paths[folder][0]
 
 def short_paths_map(paths):
     short_paths_map_dict = {}
@@ -12,14 +22,50 @@ def short_paths_map(paths):
             short_paths_map_dict[key] = path
     return short_paths_map_dict
     
+def parse_air(air):
+    model_id = None
+    version_id = None
+
+    if '@' in air:
+        model_id, version_id = air.split('@')
+    else:
+        model_id = air
+
+    model_id = int(model_id) if model_id else None
+    version_id = int(version_id) if version_id else None
+    return model_id, version_id
+
+def parse_lora_stack(stack):
+    '''
+    Parse `air:strength_model:strength_clip` entries, one per line or separated
+    by commas. Strengths default to 1.0 and `strength_clip` to `strength_model`;
+    lines starting with `#` are ignored. Raises ValueError on a malformed entry.
+    '''
+    entries = []
+    for entry in re.split(r'[\n,]+', stack or ''):
+        entry = entry.strip()
+        if not entry or entry.startswith('#'):
+            continue
+        parts = [part.strip() for part in entry.split(':')]
+        if len(parts) > 3:
+            raise ValueError(f"Invalid LoRA stack entry `{entry}`, expected `air:strength_model:strength_clip`")
+        air = parts[0]
+        parse_air(air)
+        strength_model = float(parts[1]) if len(parts) > 1 and parts[1] else 1.0
+        strength_clip = float(parts[2]) if len(parts) > 2 and parts[2] else strength_model
+        entries.append((air, strength_model, strength_clip))
+    return entries
+
+def parse_size(value):
+    '''Parse `500M`, `200G`, `1.5T` or a plain byte count; None when unset.'''
+    if value in (None, ''):
+        return None
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: {value}")
+    scale = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}[match.group(2).upper()]
+    return int(float(match.group(1)) * scale)
+
+@timed('phase', phase='model_path')
 def model_path(filename, search_paths):
-    filename = filename.lower().strip()
-    for path in search_paths:
-        for root, dirs, files in os.walk(path):
-            for file in files:
-                name, ext = os.path.splitext(file)
-                full_filename = name + ext
-                if name.lower().strip() == filename or full_filename.lower().strip() == filename:
-                    return os.path.join(root, file)
-    return None
-    
\ No newline at end of file
+    return get_model_index(search_paths).find(filename)